@@ -1,5 +1,9 @@
+import argparse
+import asyncio
 import logging
 import os
+from contextlib import AbstractContextManager, nullcontext
+from pathlib import Path
 
 import asyncpg
 import discord
@@ -7,46 +11,178 @@ import discord
 from commands.forms import FormCommands
 from commands.pages import FormPageCommands
 from commands.questions import FormQuestionCommands
-from views.starter import StarterView
+from commands.responses import ResponseCommands
+from database.listener import Listener
+from database.memory import MemoryRepository
+from database.pool import PoolProfile, listen_url, warm_up
+from database.postgres import PostgresRepository
+from database.querylog import QueryLog, QueryLogPool
+from database.repository import MEMORY_URL, PARTITIONS_AHEAD, Repository
+from utils import fast, gateway
+from utils.admission import Admission
+from utils.dispatch import Dispatcher
+from utils.logs import setup_logging
+from utils.profiling import StartupProfile
+from utils.ratelimit import RateLimiter
+from utils.templates import TemplateCache
+from views.starter import ApplicationButton, LegacyApplicationButton
 
 log = logging.getLogger(__name__)
 
 
 class Client(discord.Client):
-    pool: asyncpg.Pool
+    repo: Repository
 
-    def __init__(self) -> None:
-        super().__init__(intents=discord.Intents.default())
+    def __init__(self, profile: StartupProfile | None = None) -> None:
+        super().__init__(**gateway.client_options())
         self.tree = discord.app_commands.CommandTree(self)
+        self.dispatcher = Dispatcher()
+        self.limiter = RateLimiter()
+        # Messages with form views, so other deletes need no query
+        self.form_messages: set[int] = set()
+        self.query_log = QueryLog(init=fast.set_json_codecs)
+        self.replica_log = QueryLog(init=fast.set_json_codecs)
+        self.profile = profile
 
-    async def setup_hook(self) -> None:
-        query_ids = "SELECT DISTINCT message_id FROM form_views;"
-        query_views = "SELECT * FROM form_views WHERE message_id = $1 ORDER BY id;"
+    def phase(self, name: str) -> AbstractContextManager[None]:
+        return nullcontext() if self.profile is None else self.profile.phase(name)
 
+    async def setup_hook(self) -> None:
         # DB for persistent storage, dict below for local mapping of discord id to forms
-        self.pool = await asyncpg.create_pool(os.environ["FORMBOT_DB_URL"])
+        url = os.environ["FORMBOT_DB_URL"]
+        pools: list[QueryLogPool] = []
+        with self.phase("pool"):
+            if url == MEMORY_URL:
+                log.warning("Storing everything in memory, it is lost on exit")
+                self.repo = MemoryRepository()
+            else:
+                # Checked first, so a misconfiguration fails before connecting
+                listen = listen_url(url)
+                profile = PoolProfile()
+                pool = await self.query_log.create_pool(url, profile)
+                await warm_up(pool, profile.min_size)
+                replica = None
+                if replica_url := os.environ.get("FORMBOT_DB_REPLICA_URL"):
+                    replica = await self.replica_log.create_pool(replica_url, profile)
+                    await warm_up(replica, profile.min_size)
+                    pools.append(replica)
+                pools.append(pool)
+                repo = PostgresRepository(pool, replica)
+                repo.reads.start()
+                self.repo = repo
+        self.templates = TemplateCache(self.repo)
+        self.form_messages = set(await self.repo.form_view_messages())
+        self.admission = Admission(lambda: sum(p.waiting for p in pools))
+        self.admission.start()
         selected_forms: dict[int, int] = {}
 
-        # Add persistent views to client
-        for record in await self.pool.fetch(query_ids):
-            setup_data = [
-                (r["label"], r["emoji"], discord.ButtonStyle(r["style"]), r["form_id"])
-                for r in await self.pool.fetch(query_views, record["message_id"])
-            ]
-            view = StarterView(self.pool, record["message_id"], setup_data)
-            self.add_view(view, message_id=record["message_id"])
+        # Route clicks on form buttons of all messages, old and new
+        with self.phase("views"):
+            self.add_dynamic_items(ApplicationButton, LegacyApplicationButton)
 
         # Setup commands
-        self.tree.add_command(FormCommands(self.pool, selected_forms))
-        self.tree.add_command(FormPageCommands(self.pool, selected_forms))
-        self.tree.add_command(FormQuestionCommands(self.pool, selected_forms))
-        await self.tree.sync()
+        with self.phase("commands"):
+            self.tree.add_command(
+                FormCommands(self.repo, self.admission, selected_forms)
+            )
+            self.tree.add_command(
+                FormPageCommands(self.repo, self.admission, selected_forms)
+            )
+            self.tree.add_command(
+                FormQuestionCommands(self.repo, self.admission, selected_forms)
+            )
+            self.tree.add_command(ResponseCommands(self.repo, self.admission))
+        with self.phase("sync"):
+            await self.tree.sync()
+
+        self.maintenance = asyncio.create_task(self.maintain_partitions())
+        if url == MEMORY_URL:
+            # Versions are checked on every use, which is a dict lookup here
+            return
+        self.listener = Listener(
+            listen,
+            {"forms_changed": self.on_forms_changed},
+            self.on_listener_connect,
+            self.on_listener_disconnect,
+        )
+        self.listener.start()
+
+    async def on_forms_changed(self, payload: str) -> None:
+        # Before invalidating, so the form is not reloaded from a lagging replica
+        await self.repo.changed()
+        self.templates.invalidate(int(payload))
+
+    async def on_listener_connect(self) -> None:
+        # Changes made while disconnected were missed
+        await self.repo.changed()
+        self.templates.clear()
+        self.templates.trusted = True
+
+    def on_listener_disconnect(self) -> None:
+        self.templates.trusted = False
+
+    async def maintain_partitions(self) -> None:
+        while True:
+            try:
+                for name in await self.repo.maintain(PARTITIONS_AHEAD):
+                    log.info("Dropped partition %s", name)
+            except asyncpg.PostgresError:
+                log.exception("Failed to maintain partitions")
+            await asyncio.sleep(24 * 60 * 60)
+
+    async def on_raw_message_delete(
+        self, payload: discord.RawMessageDeleteEvent
+    ) -> None:
+        if payload.message_id in self.form_messages:
+            self.form_messages.discard(payload.message_id)
+            await self.repo.remove_form_views([payload.message_id])
+
+    async def on_raw_bulk_message_delete(
+        self, payload: discord.RawBulkMessageDeleteEvent
+    ) -> None:
+        if deleted := self.form_messages & payload.message_ids:
+            self.form_messages -= deleted
+            await self.repo.remove_form_views(list(deleted))
 
     async def on_ready(self) -> None:
         await self.change_presence(status=discord.Status.offline)
         log.info("Booted up")
+        if self.profile is not None:
+            await asyncio.to_thread(self.profile.write)
+            log.info("Startup profile written to %s", self.profile.path)
+            await self.close()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile-startup",
+        nargs="?",
+        const=Path("startup_profile.json"),
+        type=Path,
+        help="Write startup timings as JSON to this file and exit once ready.",
+        metavar="PATH",
+    )
+    parser.add_argument(
+        "--benchmark-cache",
+        nargs="?",
+        const=Path("cache_benchmark.json"),
+        type=Path,
+        help="Write memory and event CPU of each cache profile as JSON and exit.",
+        metavar="PATH",
+    )
+    args = parser.parse_args()
+    if args.benchmark_cache is not None:
+        gateway.benchmark(args.benchmark_cache)
+        raise SystemExit
+
+    listener = setup_logging()
+    fast.install()
     logging.getLogger("discord.gateway").setLevel(logging.WARNING)
-    Client().run(os.environ["DISCORD_TOKEN"], root_logger=True)
+    profile = (
+        None if args.profile_startup is None else StartupProfile(args.profile_startup)
+    )
+    try:
+        Client(profile).run(os.environ["DISCORD_TOKEN"], log_handler=None)
+    finally:
+        listener.stop()
@@ -1,21 +1,26 @@
+import io
 import logging
 
-import asyncpg
 import discord
 from discord import app_commands, ui
 
+from database import definitions
 from database.models import Form
+from database.repository import ConflictError, Repository
+from utils.admission import Admission
 from utils.responses import respond_error, respond_success
 from views.send import SendView
 
 log = logging.getLogger(__name__)
 
+MAX_DEFINITION_SIZE = 1024 * 1024
+
 
 class FormEditModal(ui.Modal):
-    def __init__(self, pool: asyncpg.Pool, form: Form) -> None:
+    def __init__(self, repo: Repository, form: Form) -> None:
         super().__init__(title=f"Editing {form.name:.37}")
-        self.pool = pool
-        self.original_name = form.name
+        self.repo = repo
+        self.form_id = form.id
 
         self.name_input: ui.TextInput[FormEditModal] = ui.TextInput(
             default=form.name,
@@ -73,20 +78,7 @@ class FormEditModal(ui.Modal):
         self.add_item(ui.Label(text="Options", component=self.checkboxes))
 
     async def on_submit(self, interaction: discord.Interaction) -> None:
-        query_exists = "SELECT TRUE FROM forms WHERE name = $1;"
-        query_update = (
-            "UPDATE forms"
-            " SET name = $1, message = $2, confirmation = $3, channel = $4, ping = $5"
-            " WHERE name = $6;"
-        )
-
         name = self.name_input.value
-        if name != self.original_name and await self.pool.fetchval(query_exists, name):
-            await respond_error(
-                interaction, f"A form with name `{name}` already exists."
-            )
-            return
-
         channel = None
         if self.channel_input.value:
             try:
@@ -95,15 +87,23 @@ class FormEditModal(ui.Modal):
                 await respond_error(interaction, "Not a valid channel ID.")
                 return
 
-        await self.pool.execute(
-            query_update,
-            name,
-            self.message_input.value or None,
-            self.confirmation_input.value or None,
-            channel,
-            "ping" in self.checkboxes.values,
-            self.original_name,
-        )
+        try:
+            updated = await self.repo.update_form(
+                self.form_id,
+                name,
+                self.message_input.value or None,
+                self.confirmation_input.value or None,
+                channel,
+                "ping" in self.checkboxes.values,
+            )
+        except ConflictError:
+            await respond_error(
+                interaction, f"A form with name `{name}` already exists."
+            )
+            return
+        if not updated:
+            await respond_error(interaction, "This form does not exist anymore.")
+            return
         log.info("%s edited form %r", interaction.user, name)
         await respond_success(interaction, f"Form `{name}` updated.")
 
@@ -111,19 +111,26 @@ class FormEditModal(ui.Modal):
 @app_commands.default_permissions(administrator=True)
 @app_commands.guild_only()
 class FormCommands(app_commands.Group):
-    def __init__(self, pool: asyncpg.Pool, selected_forms: dict[int, int]) -> None:
+    def __init__(
+        self,
+        repo: Repository,
+        admission: Admission,
+        selected_forms: dict[int, int],
+    ) -> None:
         super().__init__(name="forms")
-        self.pool = pool
+        self.repo = repo
+        self.admission = admission
         self.selected_forms = selected_forms
 
     async def form_autocomplete(
         self, _: discord.Interaction, current: str
     ) -> list[app_commands.Choice[str]]:
-        query = "SELECT name FROM forms WHERE name ILIKE $1;"
+        if self.admission.shedding():
+            return []
 
         return [
-            app_commands.Choice(name=record["name"], value=record["name"])
-            for record in await self.pool.fetch(query, current + "%")
+            app_commands.Choice(name=name, value=name)
+            for name in await self.repo.form_names(current)
         ]
 
     @app_commands.command()
@@ -132,27 +139,14 @@ class FormCommands(app_commands.Group):
         self, interaction: discord.Interaction, name: app_commands.Range[str, 1, 45]
     ) -> None:
         """Create a new form and open the editor."""
-        query_insert = (
-            "INSERT INTO forms (name) VALUES ($1)"
-            " ON CONFLICT (name) DO NOTHING"
-            " RETURNING id;"
-        )
-        query_get = "SELECT * FROM forms WHERE id = $1;"
-
-        form_id = await self.pool.fetchval(query_insert, name)
-        if form_id is None:
+        if db_form := await self.repo.create_form(name):
+            self.selected_forms[interaction.user.id] = db_form.id
+            log.info("%s created form %r", interaction.user, name)
+            await interaction.response.send_modal(FormEditModal(self.repo, db_form))
+        else:
             await respond_error(
                 interaction, f"A form with name `{name}` already exists."
             )
-            return
-
-        if row := await self.pool.fetchrow(query_get, form_id):
-            db_form = Form(**dict(row))
-            self.selected_forms[interaction.user.id] = form_id
-            log.info("%s created form %r", interaction.user, name)
-            await interaction.response.send_modal(FormEditModal(self.pool, db_form))
-        else:
-            await respond_error(interaction, "Failed to create form.")
 
     @app_commands.command()
     @app_commands.autocomplete(form=form_autocomplete)
@@ -161,12 +155,9 @@ class FormCommands(app_commands.Group):
         self, interaction: discord.Interaction, form: app_commands.Range[str, 1, 45]
     ) -> None:
         """Edit a form."""
-        query = "SELECT * FROM forms WHERE name = $1;"
-
-        if row := await self.pool.fetchrow(query, form):
-            db_form = Form(**dict(row))
+        if db_form := await self.repo.find_form(form):
             self.selected_forms[interaction.user.id] = db_form.id
-            await interaction.response.send_modal(FormEditModal(self.pool, db_form))
+            await interaction.response.send_modal(FormEditModal(self.repo, db_form))
         else:
             await respond_error(interaction, f"Form `{form}` not found.")
 
@@ -177,10 +168,8 @@ class FormCommands(app_commands.Group):
         self, interaction: discord.Interaction, form: app_commands.Range[str, 1, 45]
     ) -> None:
         """Select a form to manage its pages and questions."""
-        query = "SELECT id FROM forms WHERE name = $1;"
-
-        if form_id := await self.pool.fetchval(query, form):
-            self.selected_forms[interaction.user.id] = form_id
+        if db_form := await self.repo.find_form(form):
+            self.selected_forms[interaction.user.id] = db_form.id
             await respond_success(interaction, f"Form `{form}` selected.")
         else:
             await respond_error(interaction, f"Form `{form}` not found.")
@@ -192,9 +181,7 @@ class FormCommands(app_commands.Group):
         self, interaction: discord.Interaction, form: app_commands.Range[str, 1, 45]
     ) -> None:
         """Remove a form. This is permanent."""
-        query = "DELETE FROM forms WHERE name = $1 RETURNING id;"
-
-        if deleted_id := await self.pool.fetchval(query, form):
+        if deleted_id := await self.repo.remove_form(form):
             stale = [
                 uid for uid, fid in self.selected_forms.items() if fid == deleted_id
             ]
@@ -206,8 +193,154 @@ class FormCommands(app_commands.Group):
             await respond_error(interaction, f"Form `{form}` not found.")
 
     @app_commands.command()
+    @app_commands.autocomplete(form=form_autocomplete)
+    @app_commands.describe(
+        form="The form to configure.",
+        minutes="Interval of the response digest. Leave empty to disable.",
+    )
+    async def digest(
+        self,
+        interaction: discord.Interaction,
+        form: app_commands.Range[str, 1, 45],
+        minutes: app_commands.Range[int, 1, 1440] | None = None,
+    ) -> None:
+        """Post a summary of new responses periodically instead of pinging each."""
+        if await self.repo.set_digest(form, minutes):
+            log.info("%s set digest of form %r to %r", interaction.user, form, minutes)
+            if minutes is None:
+                await respond_success(interaction, f"Digest of `{form}` disabled.")
+            else:
+                await respond_success(
+                    interaction, f"Digest of `{form}` sent every {minutes} minutes."
+                )
+        else:
+            await respond_error(interaction, f"Form `{form}` not found.")
+
+    @app_commands.command()
+    @app_commands.autocomplete(form=form_autocomplete)
+    @app_commands.describe(
+        form="The form to configure.",
+        months="Full months to keep responses for. Leave empty to keep forever.",
+    )
+    async def retention(
+        self,
+        interaction: discord.Interaction,
+        form: app_commands.Range[str, 1, 45],
+        months: app_commands.Range[int, 1, 120] | None = None,
+    ) -> None:
+        """Set how long responses to a form are kept."""
+        if await self.repo.set_retention(form, months):
+            log.info(
+                "%s set retention of form %r to %r", interaction.user, form, months
+            )
+            if months is None:
+                await respond_success(interaction, f"Responses to `{form}` are kept.")
+            else:
+                await respond_success(
+                    interaction,
+                    f"Responses to `{form}` are removed after {months} months.",
+                )
+        else:
+            await respond_error(interaction, f"Form `{form}` not found.")
+
+    @app_commands.command()
+    @app_commands.autocomplete(form=form_autocomplete)
+    @app_commands.describe(
+        form="The form to configure.",
+        max_responses="Responses after which the form closes. Empty for no limit.",
+        cooldown="Days until a user may respond again. Leave empty for no limit.",
+    )
+    async def limits(
+        self,
+        interaction: discord.Interaction,
+        form: app_commands.Range[str, 1, 45],
+        max_responses: app_commands.Range[int, 1, 2**31 - 1] | None = None,
+        cooldown: app_commands.Range[int, 1, 3650] | None = None,
+    ) -> None:
+        """Limit the responses to a form, in total and per user."""
+        if await self.repo.set_limits(form, max_responses, cooldown):
+            log.info(
+                "%s set limits of form %r to %r responses, %r days apart",
+                interaction.user,
+                form,
+                max_responses,
+                cooldown,
+            )
+            total = "any number of" if max_responses is None else str(max_responses)
+            per_user = (
+                "" if cooldown is None else f", one per user every {cooldown} days"
+            )
+            await respond_success(
+                interaction, f"Form `{form}` accepts {total} responses{per_user}."
+            )
+        else:
+            await respond_error(interaction, f"Form `{form}` not found.")
+
+    @app_commands.command(name="import")
     @app_commands.describe(
-        channel="The text channel to send the message to.",
+        file="A JSON or YAML form definition.",
+        replace="Replace the pages and questions of a form with the same name.",
+    )
+    async def import_(
+        self,
+        interaction: discord.Interaction,
+        file: discord.Attachment,
+        replace: bool = False,
+    ) -> None:
+        """Create a form with all pages and questions from a definition file."""
+        if file.size > MAX_DEFINITION_SIZE:
+            await respond_error(interaction, "The definition file is too large.")
+            return
+
+        try:
+            definition = definitions.loads(
+                (await file.read()).decode(errors="replace"), file.filename
+            )
+        except ValueError as e:
+            await respond_error(interaction, str(e))
+            return
+
+        name = definition["name"]
+        form_id = await self.repo.import_form(definition, replace)
+        if form_id is None:
+            await respond_error(
+                interaction,
+                f"A form with name `{name}` already exists, set `replace` to update.",
+            )
+            return
+
+        self.selected_forms[interaction.user.id] = form_id
+        log.info("%s imported form %r", interaction.user, name)
+        await respond_success(interaction, f"Form `{name}` imported.")
+
+    @app_commands.command()
+    @app_commands.autocomplete(form=form_autocomplete)
+    @app_commands.describe(form="The form to export.", yaml="Export as YAML.")
+    async def export(
+        self,
+        interaction: discord.Interaction,
+        form: app_commands.Range[str, 1, 45],
+        yaml: bool = False,
+    ) -> None:
+        """Export a form with all pages and questions as a definition file."""
+        definition = await self.repo.export_form(form)
+        if definition is None:
+            await respond_error(interaction, f"Form `{form}` not found.")
+            return
+
+        filename = f"{form}.{'yaml' if yaml else 'json'}"
+        try:
+            data = definitions.dumps(definition, filename).encode()
+        except ValueError as e:
+            await respond_error(interaction, str(e))
+            return
+        await interaction.response.send_message(
+            file=discord.File(io.BytesIO(data), filename=filename), ephemeral=True
+        )
+
+    @app_commands.command()
+    @app_commands.describe(
+        channel="The text channel to send the message to, more can be added later.",
         content="The text above the form button(s).",
     )
     async def send(
@@ -217,14 +350,9 @@ class FormCommands(app_commands.Group):
         content: str,
     ) -> None:
         """Send a message with form buttons to a channel."""
-        query = "SELECT * FROM forms;"
-
-        db_forms = [Form(**dict(r)) for r in await self.pool.fetch(query)]
         embed = discord.Embed(
             title="New form message", description=f"Will be sent in {channel.mention}"
         )
-        embed.add_field(
-            name="Button 1/1", value="Current Label: [None]\nCurrent Emoji: [None]"
-        )
-        view = SendView(self.pool, channel, content, embed, db_forms)
+        view = SendView(self.repo, channel, content, embed)
+        await view.load_forms()
         await interaction.response.send_message(embed=embed, view=view)
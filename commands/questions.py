@@ -1,20 +1,21 @@
 import logging
 
-import asyncpg
 import discord
 from discord import app_commands, ui
 
 from database.models import Question
+from database.repository import ConflictError, NotFoundError, Repository
+from utils.admission import Admission
 from utils.responses import respond_error, respond_success
 
 log = logging.getLogger(__name__)
 
 
 class QuestionEditModal(ui.Modal):
-    def __init__(self, pool: asyncpg.Pool, question: Question) -> None:
+    def __init__(self, repo: Repository, question: Question) -> None:
         super().__init__(title=f"Editing {question.label:.37}")
-        self.pool = pool
-        self.page_id = question.page_id
+        self.repo = repo
+        self.question_id = question.id
 
         self.label_input: ui.TextInput[QuestionEditModal] = ui.TextInput(
             default=question.label,
@@ -85,23 +86,7 @@ class QuestionEditModal(ui.Modal):
         )
 
     async def on_submit(self, interaction: discord.Interaction) -> None:
-        query_exists = "SELECT TRUE FROM questions WHERE page_id = $1 AND label = $2;"
-        query_update = (
-            "UPDATE questions"
-            " SET label = $3, description = $4, placeholder = $5, paragraph = $6,"
-            " required = $7, min_length = $8, max_length = $9, minecraft_username = $10"
-            " WHERE page_id = $1 AND label = $2;"
-        )
-
         label = self.label_input.value
-        if label != self.label_input.default and await self.pool.fetchval(
-            query_exists, self.page_id, label
-        ):
-            await respond_error(
-                interaction,
-                f"A question with label `{label}` already exists on this page.",
-            )
-            return
 
         min_length = max_length = None
         if self.length_input.value:
@@ -123,19 +108,27 @@ class QuestionEditModal(ui.Modal):
                 )
                 return
 
-        await self.pool.execute(
-            query_update,
-            self.page_id,
-            self.label_input.default,
-            label,
-            self.description_input.value or None,
-            self.placeholder_input.value or None,
-            "paragraph" in self.checkboxes.values,
-            "required" in self.checkboxes.values,
-            min_length,
-            max_length,
-            "minecraft_username" in self.checkboxes.values,
-        )
+        try:
+            updated = await self.repo.update_question(
+                self.question_id,
+                label,
+                self.description_input.value or None,
+                self.placeholder_input.value or None,
+                "paragraph" in self.checkboxes.values,
+                "required" in self.checkboxes.values,
+                min_length,
+                max_length,
+                "minecraft_username" in self.checkboxes.values,
+            )
+        except ConflictError:
+            await respond_error(
+                interaction,
+                f"A question with label `{label}` already exists on this page.",
+            )
+            return
+        if not updated:
+            await respond_error(interaction, "This question does not exist anymore.")
+            return
         log.info("%s edited question %r", interaction.user, label)
         await respond_success(interaction, f"Question `{label}` updated.")
 
@@ -143,40 +136,38 @@ class QuestionEditModal(ui.Modal):
 @app_commands.default_permissions(administrator=True)
 @app_commands.guild_only()
 class FormQuestionCommands(app_commands.Group):
-    def __init__(self, pool: asyncpg.Pool, selected_forms: dict[int, int]) -> None:
+    def __init__(
+        self,
+        repo: Repository,
+        admission: Admission,
+        selected_forms: dict[int, int],
+    ) -> None:
         super().__init__(name="questions")
-        self.pool = pool
+        self.repo = repo
+        self.admission = admission
         self.selected_forms = selected_forms
 
     async def _fetch_numbered_questions(self, form_id: int) -> list[tuple[str, str]]:
         """Return (display_name, question_id) pairs for all questions in a form."""
-        query = (
-            "SELECT q.label, m.id AS page_id"
-            " FROM questions q JOIN pages m ON q.page_id = m.id"
-            " WHERE m.form_id = $1"
-            " ORDER BY m.id, q.id;"
-        )
-        rows = await self.pool.fetch(query, form_id)
-
         result: list[tuple[str, str]] = []
         page_num = 0
         current_page_id = None
         question_num = 0
-        for row in rows:
-            if row["page_id"] != current_page_id:
-                current_page_id = row["page_id"]
+        for question in await self.repo.questions(form_id):
+            if question.page_id != current_page_id:
+                current_page_id = question.page_id
                 page_num += 1
                 question_num = 0
             question_num += 1
-            display = f"{page_num}.{question_num} {row['label']}"
-            result.append((display, row["label"]))
+            display = f"{page_num}.{question_num} {question.label}"
+            result.append((display, question.label))
         return result
 
     async def question_autocomplete(
         self, interaction: discord.Interaction, current: str
     ) -> list[app_commands.Choice[str]]:
         form_id = self.selected_forms.get(interaction.user.id)
-        if form_id is None:
+        if form_id is None or self.admission.shedding():
             return []
 
         entries = await self._fetch_numbered_questions(form_id)
@@ -190,12 +181,13 @@ class FormQuestionCommands(app_commands.Group):
     async def page_autocomplete(
         self, interaction: discord.Interaction, current: str
     ) -> list[app_commands.Choice[str]]:
-        query = "SELECT label FROM pages WHERE form_id = $1 AND label ILIKE $2;"
-
         form_id = self.selected_forms.get(interaction.user.id)
+        if form_id is None or self.admission.shedding():
+            return []
+
         return [
-            app_commands.Choice(name=record["label"], value=record["label"])
-            for record in await self.pool.fetch(query, form_id, current + "%")
+            app_commands.Choice(name=label, value=label)
+            for label in await self.repo.page_labels(form_id, current)
         ]
 
     @app_commands.command()
@@ -211,49 +203,18 @@ class FormQuestionCommands(app_commands.Group):
         page: app_commands.Range[str, 1, 80] | None = None,
     ) -> None:
         """Add a question to the selected form and open the editor."""
-        query_page = "SELECT id FROM pages WHERE form_id = $1 AND label = $2;"
-        query_free_page = (
-            "SELECT m.id FROM pages m"
-            " WHERE m.form_id = $1 AND (SELECT COUNT(*)"
-            " FROM questions q WHERE q.page_id = m.id) < 5"
-            " ORDER BY m.id LIMIT 1;"
-        )
-        query_count_pages = "SELECT COUNT(*) FROM pages WHERE form_id = $1;"
-        query_insert_page = (
-            "INSERT INTO pages (form_id, label) VALUES ($1, $2) RETURNING id;"
-        )
-        query_insert_question = (
-            "INSERT INTO questions (page_id, label)"
-            " SELECT $1, $2"
-            " WHERE (SELECT COUNT(*) FROM questions"
-            " WHERE page_id = $1) < 5"
-            " ON CONFLICT (page_id, label) DO NOTHING"
-            " RETURNING id;"
-        )
-        query_get = "SELECT * FROM questions WHERE id = $1;"
-
         form_id = self.selected_forms.get(interaction.user.id)
         if form_id is None:
             await respond_error(interaction, "No form selected.")
             return
 
-        if page is not None:
-            page_id: int | None = await self.pool.fetchval(query_page, form_id, page)
-            if page_id is None:
-                await respond_error(
-                    interaction, f"Page `{page}` not found in this form."
-                )
-                return
-        else:
-            page_id = await self.pool.fetchval(query_free_page, form_id)
-            if page_id is None:
-                count: int = await self.pool.fetchval(query_count_pages, form_id)
-                page_id = await self.pool.fetchval(
-                    query_insert_page, form_id, f"Page {count + 1}"
-                )
+        try:
+            db_question = await self.repo.add_question(form_id, page, label)
+        except NotFoundError:
+            await respond_error(interaction, f"Page `{page}` not found in this form.")
+            return
 
-        question_id = await self.pool.fetchval(query_insert_question, page_id, label)
-        if question_id is None:
+        if db_question is None:
             await respond_error(
                 interaction,
                 f"A question with label `{label}` already exists on this page"
@@ -261,35 +222,22 @@ class FormQuestionCommands(app_commands.Group):
             )
             return
 
-        if row := await self.pool.fetchrow(query_get, question_id):
-            db_question = Question(**dict(row))
-            log.info("%s added question %r", interaction.user, label)
-            await interaction.response.send_modal(
-                QuestionEditModal(self.pool, db_question)
-            )
-        else:
-            await respond_error(interaction, "Failed to create question.")
+        log.info("%s added question %r", interaction.user, label)
+        await interaction.response.send_modal(QuestionEditModal(self.repo, db_question))
 
     @app_commands.command()
     @app_commands.autocomplete(question=question_autocomplete)
     @app_commands.describe(question="The question to edit.")
     async def edit(self, interaction: discord.Interaction, question: str) -> None:
         """Edit a question of the selected form."""
-        query = (
-            "SELECT q.* FROM questions q JOIN pages m"
-            " ON q.page_id = m.id"
-            " WHERE m.form_id = $1 AND q.label = $2;"
-        )
-
         form_id = self.selected_forms.get(interaction.user.id)
         if form_id is None:
             await respond_error(interaction, "No form selected.")
             return
 
-        if row := await self.pool.fetchrow(query, form_id, question):
-            db_question = Question(**dict(row))
+        if db_question := await self.repo.find_question(form_id, question):
             await interaction.response.send_modal(
-                QuestionEditModal(self.pool, db_question)
+                QuestionEditModal(self.repo, db_question)
             )
         else:
             await respond_error(
@@ -301,19 +249,12 @@ class FormQuestionCommands(app_commands.Group):
     @app_commands.describe(question="The question to remove.")
     async def remove(self, interaction: discord.Interaction, question: str) -> None:
         """Remove a question from the selected form. This is permanent."""
-        query = (
-            "DELETE FROM questions"
-            " WHERE label = $1 AND page_id IN"
-            " (SELECT id FROM pages WHERE form_id = $2)"
-            " RETURNING id;"
-        )
-
         form_id = self.selected_forms.get(interaction.user.id)
         if form_id is None:
             await respond_error(interaction, "No form selected.")
             return
 
-        if await self.pool.fetchval(query, question, form_id):
+        if await self.repo.remove_question(form_id, question):
             log.info("%s removed question %r", interaction.user, question)
             await respond_success(interaction, f"Question `{question}` removed.")
         else:
@@ -0,0 +1,54 @@
+import discord
+from discord import app_commands
+
+from database.repository import Repository
+from utils.admission import Admission, Priority
+from utils.responses import respond_error
+from views.history import HistoryView
+
+
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
+class ResponseCommands(app_commands.Group):
+    def __init__(self, repo: Repository, admission: Admission) -> None:
+        super().__init__(name="responses")
+        self.repo = repo
+        self.admission = admission
+
+    @app_commands.command()
+    @app_commands.describe(
+        user="The Discord user who responded.",
+        minecraft_username="The Minecraft username entered in responses.",
+    )
+    async def history(
+        self,
+        interaction: discord.Interaction,
+        user: discord.User | None = None,
+        minecraft_username: app_commands.Range[str, 3, 16] | None = None,
+    ) -> None:
+        """Show the earlier responses of an applicant across all forms."""
+        if user is None and minecraft_username is None:
+            await respond_error(
+                interaction, "Specify a user, a Minecraft username or both."
+            )
+            return
+
+        names = [user.name] if user is not None else []
+        if minecraft_username is not None:
+            names.append(minecraft_username)
+        view = HistoryView(
+            self.repo,
+            f"Responses of {' / '.join(names)}",
+            user.id if user is not None else None,
+            minecraft_username,
+        )
+        async with self.admission.admit(interaction, Priority.QUERY) as admitted:
+            if not admitted:
+                return
+            embed = await view.load()
+        if interaction.response.is_done():
+            await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        else:
+            await interaction.response.send_message(
+                embed=embed, view=view, ephemeral=True
+            )
@@ -0,0 +1,175 @@
+"""Import and export forms as JSON (or YAML) definitions.
+
+A definition holds the form settings and a list of pages, each with a list of
+questions, using the column names of the tables. Omitted fields take their
+database defaults. YAML requires PyYAML to be installed.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+import asyncpg
+
+from database.pool import PoolProfile
+from database.postgres import PostgresRepository
+from utils.fast import set_json_codecs
+
+# Type and maximum length (or value) of each field
+FORM_FIELDS: dict[str, tuple[type, int]] = {
+    "name": (str, 45),
+    "message": (str, 2000),
+    "confirmation": (str, 2000),
+    "channel": (int, 2**63 - 1),
+    "ping": (bool, 1),
+    "digest": (int, 1440),
+    "retention": (int, 120),
+    "max_responses": (int, 2**31 - 1),
+    "cooldown": (int, 3650),
+}
+PAGE_FIELDS: dict[str, tuple[type, int]] = {
+    "label": (str, 80),
+    "title": (str, 45),
+}
+QUESTION_FIELDS: dict[str, tuple[type, int]] = {
+    "label": (str, 45),
+    "description": (str, 100),
+    "placeholder": (str, 100),
+    "paragraph": (bool, 1),
+    "required": (bool, 1),
+    "min_length": (int, 1024),
+    "max_length": (int, 1024),
+    "minecraft_username": (bool, 1),
+}
+MAX_QUESTIONS = 5
+
+
+def _check(
+    data: object, fields: dict[str, tuple[type, int]], where: str, nested: str = ""
+) -> dict[str, Any]:
+    if not isinstance(data, dict):
+        raise ValueError(f"{where.capitalize()} must be an object.")
+    for key, value in data.items():
+        if key == nested:
+            continue
+        if key not in fields:
+            raise ValueError(f"Unknown field `{key}` in {where}.")
+        kind, limit = fields[key]
+        if value is None:
+            continue
+        # bool is a subclass of int, so compare types exactly
+        if type(value) is not kind:
+            raise ValueError(f"Field `{key}` in {where} must be a {kind.__name__}.")
+        if isinstance(value, str) and len(value) > limit:
+            raise ValueError(f"Field `{key}` in {where} is longer than {limit}.")
+        if type(value) is int and not 0 <= value <= limit:
+            raise ValueError(f"Field `{key}` in {where} must be in 0-{limit}.")
+    label = "name" if "name" in fields else "label"
+    if not data.get(label):
+        raise ValueError(f"{where.capitalize()} has no {label}.")
+    return data
+
+
+def validate(definition: object) -> dict[str, Any]:
+    """Check a parsed definition, raising ValueError with a readable message."""
+    form = _check(definition, FORM_FIELDS, "the form", "pages")
+    pages = form.get("pages", [])
+    if not isinstance(pages, list):
+        raise ValueError("`pages` must be a list.")
+
+    page_labels = set()
+    for i, page in enumerate(pages, 1):
+        _check(page, PAGE_FIELDS, f"page {i}", "questions")
+        if page["label"] in page_labels:
+            raise ValueError(f"Page label `{page['label']}` is used twice.")
+        page_labels.add(page["label"])
+
+        questions = page.get("questions", [])
+        if not isinstance(questions, list) or len(questions) > MAX_QUESTIONS:
+            raise ValueError(
+                f"`questions` of page {i} must be a list of up to {MAX_QUESTIONS}."
+            )
+        question_labels = set()
+        for j, question in enumerate(questions, 1):
+            _check(question, QUESTION_FIELDS, f"question {i}.{j}")
+            if question["label"] in question_labels:
+                raise ValueError(
+                    f"Question label `{question['label']}` is used twice on page {i}."
+                )
+            question_labels.add(question["label"])
+            if (question.get("min_length") or 0) > (question.get("max_length") or 1024):
+                raise ValueError(f"Question {i}.{j} has min_length above max_length.")
+    return form
+
+
+def _yaml() -> ModuleType:
+    try:
+        return importlib.import_module("yaml")
+    except ImportError:
+        raise ValueError("YAML definitions require PyYAML to be installed.") from None
+
+
+def loads(text: str, filename: str) -> dict[str, Any]:
+    """Parse and validate a definition, as YAML if the file name says so."""
+    try:
+        if filename.endswith((".yaml", ".yml")):
+            definition = _yaml().safe_load(text)
+        else:
+            definition = json.loads(text)
+    except Exception as e:  # Also yaml.YAMLError, which needs no import this way
+        raise ValueError(f"Could not parse `{filename}`: {e}") from None
+    return validate(definition)
+
+
+def dumps(definition: dict[str, Any], filename: str) -> str:
+    if filename.endswith((".yaml", ".yml")):
+        return str(_yaml().safe_dump(definition, allow_unicode=True, sort_keys=False))
+    return json.dumps(definition, indent=2, ensure_ascii=False) + "\n"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m database.definitions", description=__doc__.split("\n")[0]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a form to a file.")
+    export_parser.add_argument("name", help="Name of the form.")
+    export_parser.add_argument("file", type=Path, help="JSON or YAML file.")
+    import_parser = commands.add_parser("import", help="Create a form from a file.")
+    import_parser.add_argument("file", type=Path, help="JSON or YAML file.")
+    import_parser.add_argument(
+        "--replace", action="store_true", help="Replace a form with the same name."
+    )
+    args = parser.parse_args()
+
+    pool = await asyncpg.create_pool(
+        os.environ["FORMBOT_DB_URL"],
+        init=set_json_codecs,
+        **PoolProfile(min_size=1, max_size=1).options(),
+    )
+    repo = PostgresRepository(pool)
+    try:
+        if args.command == "export":
+            definition = await repo.export_form(args.name)
+            if definition is None:
+                sys.exit(f"Form `{args.name}` not found.")
+            args.file.write_text(dumps(definition, args.file.name))
+        else:
+            try:
+                definition = loads(args.file.read_text(), args.file.name)
+            except ValueError as e:
+                sys.exit(str(e))
+            if await repo.import_form(definition, args.replace) is None:
+                sys.exit(f"Form `{definition['name']}` already exists.")
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
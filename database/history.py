@@ -0,0 +1,33 @@
+"""Earlier responses of an applicant, by Discord user ID or Minecraft username.
+
+Responses are looked up through Repository.history_summary and history_page,
+which match Minecraft usernames ignoring case.
+"""
+
+import re
+
+import discord
+
+from database.repository import Repository
+from utils.embeds import Field
+
+MINECRAFT_USERNAME = re.compile(r"[A-Za-z0-9_]{3,16}")
+PAGE_SIZE = 10
+
+
+def minecraft_username(answer: str | None) -> str | None:
+    """The answer if it can be a Minecraft username, which is all that's indexed."""
+    if answer is None or not MINECRAFT_USERNAME.fullmatch(answer):
+        return None
+    return answer
+
+
+async def history_field(
+    repo: Repository, user_id: int, minecraft_name: str | None
+) -> Field:
+    """Summary of earlier responses per form, for the result embed."""
+    lines = [
+        f"{count}x {name}, last {discord.utils.format_dt(last, 'd')}"
+        for name, count, last in await repo.history_summary(user_id, minecraft_name)
+    ]
+    return ("Earlier responses:", "\n".join(lines) or "None", False)
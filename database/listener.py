@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+import asyncpg
+
+log = logging.getLogger(__name__)
+
+# Seconds to wait between reconnection attempts, doubled up to the maximum
+MIN_BACKOFF = 1
+MAX_BACKOFF = 60
+# Seconds between checks that the idle connection is still alive
+PING_INTERVAL = 60
+
+
+class Listener:
+    """Dedicated connection receiving NOTIFYs sent by the triggers in schema.sql.
+
+    Reconnects when the connection is lost. As notifications sent meanwhile are
+    missed, `on_connect` is called after each (re)connect to resynchronise.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        handlers: dict[str, Callable[[str], Awaitable[None]]],
+        on_connect: Callable[[], Awaitable[None]],
+        on_disconnect: Callable[[], None],
+    ) -> None:
+        self.dsn = dsn
+        self.handlers = handlers
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.lost = asyncio.Event()
+        self.task: asyncio.Task[None] | None = None
+        self.pending: set[asyncio.Task[None]] = set()
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        backoff = MIN_BACKOFF
+        while True:
+            try:
+                conn = await asyncpg.connect(self.dsn)
+            except (OSError, TimeoutError, asyncpg.PostgresError) as e:
+                log.warning(
+                    "Listener failed to connect, retrying in %ds: %s", backoff, e
+                )
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+
+            self.lost.clear()
+            conn.add_termination_listener(lambda _: self.lost.set())
+            try:
+                for channel in self.handlers:
+                    await conn.add_listener(channel, self.dispatch)
+                backoff = MIN_BACKOFF
+                await self.on_connect()
+                log.info("Listening for %s", ", ".join(self.handlers))
+                while not self.lost.is_set():
+                    try:
+                        await asyncio.wait_for(self.lost.wait(), PING_INTERVAL)
+                    except TimeoutError:
+                        await conn.execute("SELECT 1;")
+                log.warning("Listener connection lost, reconnecting")
+            except (
+                OSError,
+                TimeoutError,
+                asyncpg.InterfaceError,
+                asyncpg.PostgresError,
+            ) as e:
+                log.warning("Listener connection failed, reconnecting: %s", e)
+            finally:
+                self.on_disconnect()
+                conn.terminate()
+
+    def dispatch(self, _conn: object, _pid: int, channel: str, payload: object) -> None:
+        task = asyncio.create_task(self.handle(channel, str(payload)))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def handle(self, channel: str, payload: str) -> None:
+        try:
+            await self.handlers[channel](payload)
+        except Exception:
+            log.exception("Failed to handle notification on %s: %r", channel, payload)
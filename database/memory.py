@@ -0,0 +1,592 @@
+"""Storage in dicts, for trying out the bot and for tests without Postgres.
+
+Mirrors the constraints, triggers and functions of schema.sql. No method awaits,
+so each runs atomically on the event loop like a transaction. Rows are replaced
+rather than changed in place, since the template cache holds on to them.
+"""
+
+import dataclasses
+from dataclasses import dataclass, fields
+from datetime import UTC, datetime, timedelta
+from itertools import count
+from typing import Any
+from uuid import UUID
+
+from database.definitions import MAX_QUESTIONS
+from database.models import Form, FormView, HistoryEntry, Limits, Page, Question
+from database.repository import (
+    Button,
+    ConflictError,
+    FormTree,
+    LimitError,
+    NotFoundError,
+    Repository,
+)
+
+# Age of expired idempotency keys, like in maintain_partitions()
+SUBMISSION_KEYS = timedelta(days=1)
+
+
+@dataclass(slots=True)
+class Response:
+    id: int
+    username: str
+    user_id: int
+    minecraft_username: str | None
+    timestamp: datetime
+    form_id: int
+    form_version: int
+    submission: UUID
+    answers: list[tuple[int, str | None]]
+
+
+def _matches(text: str, prefix: str) -> bool:
+    # ILIKE prefix + '%'
+    return text.lower().startswith(prefix.lower())
+
+
+class MemoryRepository(Repository):
+    def __init__(self) -> None:
+        self.forms: dict[int, Form] = {}
+        self.pages: dict[int, Page] = {}
+        self.question_rows: dict[int, Question] = {}
+        self.versions: dict[tuple[int, int], dict[str, Any]] = {}
+        self.views: dict[int, FormView] = {}
+        self.responses: dict[int, Response] = {}
+        # Counters of form_counts and last_submissions
+        self.counts: dict[int, int] = {}
+        self.last_submissions: dict[tuple[int, int], datetime] = {}
+        # Rows of submissions, the idempotency keys of add_response, by creation
+        self.submissions: dict[tuple[UUID, int], datetime] = {}
+        self.ids = {
+            table: count(1)
+            for table in ("forms", "pages", "questions", "form_views", "responses")
+        }
+
+    def _bump(self, form_id: int) -> None:
+        form = self.forms[form_id]
+        self.forms[form_id] = dataclasses.replace(form, version=form.version + 1)
+
+    def _form_by_name(self, name: str) -> Form | None:
+        return next((f for f in self.forms.values() if f.name == name), None)
+
+    def _form_pages(self, form_id: int) -> list[Page]:
+        return [p for p in self.pages.values() if p.form_id == form_id]
+
+    def _page_questions(self, page_id: int) -> list[Question]:
+        return [q for q in self.question_rows.values() if q.page_id == page_id]
+
+    def _form_questions(self, form_id: int) -> list[Question]:
+        return [
+            q for p in self._form_pages(form_id) for q in self._page_questions(p.id)
+        ]
+
+    def _insert_page(self, form_id: int, label: str, title: str | None) -> Page:
+        page = Page(next(self.ids["pages"]), form_id, label, title, 0)
+        self.pages[page.id] = page
+        return page
+
+    def _insert_question(
+        self, page: Page, label: str, values: dict[str, Any] | None = None
+    ) -> Question:
+        values = values or {}
+        question = Question(
+            next(self.ids["questions"]),
+            page.id,
+            label,
+            values.get("description"),
+            values.get("placeholder"),
+            values.get("paragraph") or False,
+            values.get("required") is not False,
+            values.get("min_length"),
+            values.get("max_length"),
+            values.get("minecraft_username") or False,
+        )
+        self.question_rows[question.id] = question
+        self.pages[page.id] = dataclasses.replace(
+            page, question_count=page.question_count + 1
+        )
+        return question
+
+    def _delete_page(self, page_id: int) -> None:
+        for question in self._page_questions(page_id):
+            del self.question_rows[question.id]
+        del self.pages[page_id]
+
+    async def changed(self) -> None:
+        pass  # Only this process has access
+
+    # Forms
+
+    async def form_names(self, prefix: str) -> list[str]:
+        return [f.name for f in self.forms.values() if _matches(f.name, prefix)]
+
+    async def create_form(self, name: str) -> Form | None:
+        if self._form_by_name(name) is not None:
+            return None
+        form = Form(
+            next(self.ids["forms"]),
+            name,
+            None,
+            None,
+            None,
+            False,
+            None,
+            1,
+            None,
+            None,
+            None,
+        )
+        self.forms[form.id] = form
+        return form
+
+    async def find_form(self, name: str) -> Form | None:
+        return self._form_by_name(name)
+
+    async def form_page(
+        self, search: str, after: str | None, limit: int
+    ) -> list[tuple[int, str]]:
+        forms = sorted(
+            (f.name, f.id)
+            for f in self.forms.values()
+            if search.lower() in f.name.lower() and f.name > (after or "")
+        )
+        return [(form_id, name) for name, form_id in forms[:limit]]
+
+    async def update_form(
+        self,
+        form_id: int,
+        name: str,
+        message: str | None,
+        confirmation: str | None,
+        channel: int | None,
+        ping: bool,
+    ) -> bool:
+        form = self.forms.get(form_id)
+        if form is None:
+            return False
+        other = self._form_by_name(name)
+        if other is not None and other.id != form_id:
+            raise ConflictError
+        self.forms[form_id] = dataclasses.replace(
+            form,
+            name=name,
+            message=message,
+            confirmation=confirmation,
+            channel=channel,
+            ping=ping,
+            version=form.version + 1,
+        )
+        return True
+
+    async def remove_form(self, name: str) -> int | None:
+        form = self._form_by_name(name)
+        if form is None:
+            return None
+        for page in self._form_pages(form.id):
+            self._delete_page(page.id)
+        self.versions = {k: v for k, v in self.versions.items() if k[0] != form.id}
+        self.views = {k: v for k, v in self.views.items() if v.form_id != form.id}
+        self.responses = {
+            k: v for k, v in self.responses.items() if v.form_id != form.id
+        }
+        self.counts.pop(form.id, None)
+        self.last_submissions = {
+            k: v for k, v in self.last_submissions.items() if k[0] != form.id
+        }
+        self.submissions = {
+            k: v for k, v in self.submissions.items() if k[1] != form.id
+        }
+        del self.forms[form.id]
+        return form.id
+
+    async def set_digest(self, name: str, minutes: int | None) -> bool:
+        form = self._form_by_name(name)
+        if form is None:
+            return False
+        self.forms[form.id] = dataclasses.replace(
+            form, digest=minutes, version=form.version + 1
+        )
+        return True
+
+    async def set_retention(self, name: str, months: int | None) -> bool:
+        form = self._form_by_name(name)
+        if form is None:
+            return False
+        self.forms[form.id] = dataclasses.replace(
+            form, retention=months, version=form.version + 1
+        )
+        return True
+
+    async def set_limits(
+        self, name: str, max_responses: int | None, cooldown: int | None
+    ) -> bool:
+        form = self._form_by_name(name)
+        if form is None:
+            return False
+        self.forms[form.id] = dataclasses.replace(
+            form,
+            max_responses=max_responses,
+            cooldown=cooldown,
+            version=form.version + 1,
+        )
+        return True
+
+    async def limits(self, form_id: int, user_id: int) -> Limits | None:
+        form = self.forms.get(form_id)
+        if form is None:
+            return None
+        last = self.last_submissions.get((form_id, user_id))
+        return Limits(
+            form.max_responses is not None
+            and self.counts.get(form_id, 0) >= form.max_responses,
+            None
+            if last is None or form.cooldown is None
+            else last + timedelta(days=form.cooldown),
+        )
+
+    async def import_form(
+        self, definition: dict[str, Any], replace: bool
+    ) -> int | None:
+        existing = self._form_by_name(definition["name"])
+        if existing is not None and not replace:
+            return None
+        form = Form(
+            next(self.ids["forms"]) if existing is None else existing.id,
+            definition["name"],
+            definition.get("message"),
+            definition.get("confirmation"),
+            definition.get("channel"),
+            definition.get("ping") or False,
+            definition.get("digest"),
+            1 if existing is None else existing.version + 1,
+            definition.get("retention"),
+            definition.get("max_responses"),
+            definition.get("cooldown"),
+        )
+        self.forms[form.id] = form
+        if existing is not None:
+            for page in self._form_pages(form.id):
+                self._delete_page(page.id)
+
+        for page_data in definition.get("pages") or []:
+            page = self._insert_page(
+                form.id, page_data["label"], page_data.get("title")
+            )
+            for question_data in page_data.get("questions") or []:
+                self._insert_question(page, question_data["label"], question_data)
+                page = self.pages[page.id]
+        return form.id
+
+    async def export_form(self, name: str) -> dict[str, Any] | None:
+        form = self._form_by_name(name)
+        if form is None:
+            return None
+        skip = {"id", "page_id"}
+        definition = {
+            f.name: getattr(form, f.name)
+            for f in fields(Form)
+            if f.name not in {"id", "version"}
+        }
+        definition["pages"] = [
+            {
+                "label": page.label,
+                "title": page.title,
+                "questions": [
+                    {
+                        f.name: getattr(q, f.name)
+                        for f in fields(Question)
+                        if f.name not in skip
+                    }
+                    for q in self._page_questions(page.id)
+                ],
+            }
+            for page in self._form_pages(form.id)
+        ]
+        return definition
+
+    # Pages
+
+    async def page_labels(self, form_id: int, prefix: str) -> list[str]:
+        return [p.label for p in self._form_pages(form_id) if _matches(p.label, prefix)]
+
+    async def add_page(self, form_id: int, label: str) -> Page | None:
+        if form_id not in self.forms or await self.find_page(form_id, label):
+            return None
+        page = self._insert_page(form_id, label, None)
+        self._bump(form_id)
+        return page
+
+    async def find_page(self, form_id: int, label: str) -> Page | None:
+        return next((p for p in self._form_pages(form_id) if p.label == label), None)
+
+    async def update_page(self, page_id: int, label: str, title: str | None) -> bool:
+        page = self.pages.get(page_id)
+        if page is None:
+            return False
+        other = await self.find_page(page.form_id, label)
+        if other is not None and other.id != page_id:
+            raise ConflictError
+        if (label, title) != (page.label, page.title):
+            self.pages[page_id] = dataclasses.replace(page, label=label, title=title)
+            self._bump(page.form_id)
+        return True
+
+    async def remove_page(self, form_id: int, label: str) -> bool:
+        page = await self.find_page(form_id, label)
+        if page is None:
+            return False
+        self._delete_page(page.id)
+        self._bump(form_id)
+        return True
+
+    # Questions
+
+    async def questions(self, form_id: int) -> list[Question]:
+        return self._form_questions(form_id)
+
+    async def add_question(
+        self, form_id: int, page_label: str | None, label: str
+    ) -> Question | None:
+        if page_label is not None:
+            page = await self.find_page(form_id, page_label)
+            if page is None:
+                raise NotFoundError
+        else:
+            pages = self._form_pages(form_id)
+            page = next((p for p in pages if p.question_count < MAX_QUESTIONS), None)
+            if page is None:
+                # Skips labels taken by full pages, like the loop of add_question
+                labels = {p.label for p in pages}
+                n = len(pages) + 1
+                while f"Page {n}" in labels:
+                    n += 1
+                page = self._insert_page(form_id, f"Page {n}", None)
+                self._bump(form_id)
+
+        if page.question_count >= MAX_QUESTIONS or any(
+            q.label == label for q in self._page_questions(page.id)
+        ):
+            return None
+        question = self._insert_question(page, label)
+        self._bump(form_id)
+        return question
+
+    async def find_question(self, form_id: int, label: str) -> Question | None:
+        return next(
+            (q for q in self._form_questions(form_id) if q.label == label), None
+        )
+
+    async def update_question(
+        self,
+        question_id: int,
+        label: str,
+        description: str | None,
+        placeholder: str | None,
+        paragraph: bool,
+        required: bool,
+        min_length: int | None,
+        max_length: int | None,
+        minecraft_username: bool,
+    ) -> bool:
+        question = self.question_rows.get(question_id)
+        if question is None:
+            return False
+        if any(
+            q.label == label and q.id != question_id
+            for q in self._page_questions(question.page_id)
+        ):
+            raise ConflictError
+        self.question_rows[question_id] = dataclasses.replace(
+            question,
+            label=label,
+            description=description,
+            placeholder=placeholder,
+            paragraph=paragraph,
+            required=required,
+            min_length=min_length,
+            max_length=max_length,
+            minecraft_username=minecraft_username,
+        )
+        self._bump(self.pages[question.page_id].form_id)
+        return True
+
+    async def remove_question(self, form_id: int, label: str) -> bool:
+        removed = [q for q in self._form_questions(form_id) if q.label == label]
+        for question in removed:
+            del self.question_rows[question.id]
+            page = self.pages[question.page_id]
+            self.pages[page.id] = dataclasses.replace(
+                page, question_count=page.question_count - 1
+            )
+        if removed:
+            self._bump(form_id)
+        return bool(removed)
+
+    # Versions
+
+    async def form_version(self, form_id: int) -> int | None:
+        form = self.forms.get(form_id)
+        return None if form is None else form.version
+
+    async def form_tree(self, form_id: int) -> FormTree | None:
+        form = self.forms.get(form_id)
+        if form is None:
+            return None
+        return form, [
+            (page, self._page_questions(page.id)) for page in self._form_pages(form_id)
+        ]
+
+    async def snapshot(self, form_id: int, version: int) -> dict[str, Any] | None:
+        return self.versions.get((form_id, version))
+
+    async def save_snapshot(
+        self, form_id: int, version: int, snapshot: dict[str, Any]
+    ) -> None:
+        if form_id in self.forms:
+            self.versions.setdefault((form_id, version), snapshot)
+
+    # Form views
+
+    async def form_views(self, message_id: int) -> list[FormView]:
+        return [v for v in self.views.values() if v.message_id == message_id]
+
+    async def add_form_views(
+        self, message_ids: list[int], buttons: list[Button]
+    ) -> None:
+        for message_id in message_ids:
+            for label, emoji, style, form_id in buttons:
+                view = FormView(
+                    next(self.ids["form_views"]),
+                    message_id,
+                    label,
+                    emoji,
+                    style,
+                    form_id,
+                )
+                self.views[view.id] = view
+
+    async def remove_form_views(self, message_ids: list[int]) -> None:
+        removed = set(message_ids)
+        self.views = {
+            k: v for k, v in self.views.items() if v.message_id not in removed
+        }
+
+    async def form_view_messages(self) -> list[int]:
+        return sorted({v.message_id for v in self.views.values()})
+
+    # Responses
+
+    async def add_response(
+        self,
+        username: str,
+        user_id: int,
+        minecraft_username: str | None,
+        timestamp: datetime,
+        form_id: int,
+        form_version: int,
+        submission: UUID,
+        answers: list[tuple[int, str | None]],
+    ) -> int | None:
+        if (submission, form_id) in self.submissions:
+            return None
+        if (form_id, form_version) not in self.versions:
+            raise NotFoundError  # Like the foreign key on form_versions
+        form = self.forms[form_id]
+        last = self.last_submissions.get((form_id, user_id))
+        if last is not None and form.cooldown:
+            next_submission = last + timedelta(days=form.cooldown)
+            if timestamp < next_submission:
+                raise LimitError(Limits(False, next_submission))
+        responses = self.counts.get(form_id, 0) + 1
+        if form.max_responses is not None and responses > form.max_responses:
+            raise LimitError(Limits(True, None))
+        self.counts[form_id] = responses
+        self.last_submissions[form_id, user_id] = max(last or timestamp, timestamp)
+        self.submissions[submission, form_id] = datetime.now(UTC)
+        response = Response(
+            next(self.ids["responses"]),
+            username,
+            user_id,
+            minecraft_username,
+            timestamp,
+            form_id,
+            form_version,
+            submission,
+            answers,
+        )
+        self.responses[response.id] = response
+        return response.id
+
+    def _history(
+        self, user_id: int | None, minecraft_username: str | None
+    ) -> list[Response]:
+        name = None if minecraft_username is None else minecraft_username.lower()
+        return [
+            r
+            for r in self.responses.values()
+            if r.user_id == user_id
+            or (
+                name is not None
+                and r.minecraft_username is not None
+                and r.minecraft_username.lower() == name
+            )
+        ]
+
+    async def history_summary(
+        self, user_id: int | None, minecraft_username: str | None
+    ) -> list[tuple[str, int, datetime]]:
+        summary: dict[str, tuple[str, int, datetime]] = {}
+        for r in self._history(user_id, minecraft_username):
+            name = self.forms[r.form_id].name
+            _, n, last = summary.get(name, (name, 0, r.timestamp))
+            summary[name] = (name, n + 1, max(last, r.timestamp))
+        return sorted(summary.values(), key=lambda s: s[2], reverse=True)
+
+    async def history_page(
+        self,
+        user_id: int | None,
+        minecraft_username: str | None,
+        before: tuple[datetime, int] | None,
+        limit: int,
+    ) -> list[HistoryEntry]:
+        responses = sorted(
+            (
+                r
+                for r in self._history(user_id, minecraft_username)
+                if before is None or (r.timestamp, r.id) < before
+            ),
+            key=lambda r: (r.timestamp, r.id),
+            reverse=True,
+        )
+        return [
+            HistoryEntry(
+                r.id,
+                r.timestamp,
+                self.forms[r.form_id].name,
+                r.username,
+                r.minecraft_username,
+            )
+            for r in responses[:limit]
+        ]
+
+    async def maintain(self, ahead: int) -> list[str]:  # noqa: ARG002
+        """Remove responses past retention, named after the partitions they'd be in.
+
+        There are no partitions to create in memory. Expires submission keys.
+        """
+        now = datetime.now(UTC)
+        self.submissions = {
+            k: v for k, v in self.submissions.items() if v >= now - SUBMISSION_KEYS
+        }
+        dropped: set[str] = set()
+        for form in self.forms.values():
+            if form.retention is None:
+                continue
+            months = now.year * 12 + now.month - 1 - form.retention
+            cutoff = datetime(months // 12, months % 12 + 1, 1, tzinfo=UTC)
+            for r in list(self.responses.values()):
+                if r.form_id == form.id and r.timestamp < cutoff:
+                    del self.responses[r.id]
+                    dropped.add(f"responses_{form.id}_{r.timestamp:%Y%m}")
+        return sorted(dropped)
@@ -0,0 +1,178 @@
+"""Upgrade a database created from an older schema.sql, in one transaction.
+
+Brings forms and pages up to date, moves the unpartitioned responses and answers
+into the partitioned tables and creates everything else schema.sql defines,
+skipping what exists and replacing the functions. Responses of that time have
+no form version, submission or user, so they are stored with a snapshot of the
+current form, a new submission ID and user 0. Run with the bot stopped.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import asyncpg
+
+from database.repository import PARTITIONS_AHEAD
+
+SCHEMA = Path(__file__).with_name("schema.sql")
+
+# Columns added since, in the order of schema.sql
+FORMS_COLUMNS = (
+    "digest SMALLINT",
+    "version INTEGER NOT NULL DEFAULT 1",
+    "retention SMALLINT",
+    "max_responses INTEGER",
+    "cooldown SMALLINT",
+)
+# Objects of older schemas whose names the new tables take
+LEGACY_RENAMES = (
+    "ALTER TABLE responses RENAME TO legacy_responses;",
+    "ALTER TABLE answers RENAME TO legacy_answers;",
+    "ALTER INDEX IF EXISTS responses_pkey RENAME TO legacy_responses_pkey;",
+    "ALTER INDEX IF EXISTS answers_pkey RENAME TO legacy_answers_pkey;",
+    "ALTER INDEX IF EXISTS idx_responses_form_id RENAME TO legacy_responses_form_id;",
+    "ALTER SEQUENCE IF EXISTS responses_id_seq RENAME TO legacy_responses_id_seq;",
+)
+EXISTING = (
+    asyncpg.DuplicateTableError,
+    asyncpg.DuplicateObjectError,
+    asyncpg.DuplicateFunctionError,
+)
+
+
+def statements(sql: str) -> list[str]:
+    """Split a script at the semicolons ending a line outside of $$ bodies."""
+    result: list[str] = []
+    current: list[str] = []
+    in_body = False
+    for line in sql.splitlines():
+        if not current and (not line.strip() or line.startswith("--")):
+            continue
+        current.append(line)
+        in_body ^= line.count("$$") % 2 == 1
+        if not in_body and line.rstrip().endswith(";"):
+            result.append("\n".join(current))
+            current = []
+    return result
+
+
+async def apply_schema(conn: asyncpg.Connection) -> None:
+    for statement in statements(SCHEMA.read_text()):
+        if statement.startswith("CREATE FUNCTION"):
+            statement = "CREATE OR REPLACE" + statement.removeprefix("CREATE")
+        try:
+            async with conn.transaction():
+                await conn.execute(statement)
+        except EXISTING:
+            pass
+
+
+async def upgrade_forms(conn: asyncpg.Connection) -> None:
+    query_forms = "ALTER TABLE forms " + ", ".join(
+        f"ADD COLUMN IF NOT EXISTS {column}" for column in FORMS_COLUMNS
+    )
+    query_pages = (
+        "ALTER TABLE pages ADD COLUMN IF NOT EXISTS question_count SMALLINT"
+        " NOT NULL DEFAULT 0 CHECK (question_count <= 5);"
+    )
+    query_counts = (
+        "UPDATE pages p SET question_count ="
+        " (SELECT count(*) FROM questions q WHERE q.page_id = p.id);"
+    )
+
+    await conn.execute(query_forms)
+    await conn.execute(query_pages)
+    await conn.execute(query_counts)
+
+
+async def move_responses(conn: asyncpg.Connection) -> int:
+    # Partitions reach back to the oldest response, retention applies later
+    query_partitions = (
+        "SELECT create_partitions(f.id, $1, coalesce("
+        "(SELECT min(timestamp) FROM legacy_responses r WHERE r.form_id = f.id),"
+        " now())) FROM forms f;"
+    )
+    # Laid out like utils.templates.to_snapshot
+    query_snapshots = (
+        "INSERT INTO form_versions (form_id, version, snapshot)"
+        " SELECT f.id, f.version, jsonb_build_object('form', to_jsonb(f), 'pages',"
+        " coalesce((SELECT jsonb_agg(jsonb_build_object('page', to_jsonb(p),"
+        " 'questions', coalesce((SELECT jsonb_agg(to_jsonb(q) ORDER BY q.id)"
+        " FROM questions q WHERE q.page_id = p.id), '[]')) ORDER BY p.id)"
+        " FROM pages p WHERE p.form_id = f.id), '[]'))"
+        " FROM forms f ON CONFLICT DO NOTHING;"
+    )
+    query_responses = (
+        "INSERT INTO responses (id, username, user_id, minecraft_username,"
+        " timestamp, form_id, form_version, submission)"
+        " SELECT r.id, r.username, 0, NULL, r.timestamp, r.form_id, f.version,"
+        " gen_random_uuid()"
+        " FROM legacy_responses r JOIN forms f ON f.id = r.form_id;"
+    )
+    # Answers to removed questions lost their question before
+    query_answers = (
+        "INSERT INTO answers (response_id, form_id, timestamp, question_id, answer)"
+        " SELECT a.response_id, r.form_id, r.timestamp, a.question_id, a.answer"
+        " FROM legacy_answers a JOIN legacy_responses r ON r.id = a.response_id"
+        " WHERE a.question_id IS NOT NULL;"
+    )
+    query_sequence = (
+        "SELECT setval(pg_get_serial_sequence('responses', 'id'), max(id))"
+        " FROM responses;"
+    )
+    query_counts = (
+        "INSERT INTO form_counts (form_id, responses)"
+        " SELECT form_id, count(*) FROM responses GROUP BY form_id"
+        " ON CONFLICT (form_id) DO UPDATE SET responses = excluded.responses;"
+    )
+    query_applicants = (
+        "INSERT INTO applicant_counts (form_id, user_id, minecraft_username,"
+        " month, responses, last)"
+        " SELECT form_id, user_id, coalesce(lower(minecraft_username), ''),"
+        " date_trunc('month', timestamp) AS month, count(*), max(timestamp)"
+        " FROM responses GROUP BY 1, 2, 3, 4;"
+    )
+    query_drop = "DROP TABLE legacy_answers, legacy_responses;"
+
+    await conn.execute(query_partitions, PARTITIONS_AHEAD)
+    await conn.execute(query_snapshots)
+    moved = int((await conn.execute(query_responses)).split()[-1])
+    await conn.execute(query_answers)
+    await conn.execute(query_sequence)
+    await conn.execute(query_counts)
+    await conn.execute(query_applicants)
+    await conn.execute(query_drop)
+    return moved
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m database.migrate", description=__doc__.split("\n")[0]
+    )
+    parser.parse_args()
+    query = "SELECT relkind FROM pg_class WHERE oid = to_regclass('responses');"
+
+    conn = await asyncpg.connect(os.environ["FORMBOT_DB_URL"])
+    try:
+        kind = await conn.fetchval(query)
+        if kind is None:
+            sys.exit("No responses table, create the database from schema.sql.")
+        if kind == "p":
+            print("Responses are already partitioned, nothing to do.")
+            return
+        async with conn.transaction():
+            for statement in LEGACY_RENAMES:
+                await conn.execute(statement)
+            await upgrade_forms(conn)
+            await apply_schema(conn)
+            moved = await move_responses(conn)
+        print(f"Moved {moved} responses into the partitioned tables.")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,26 +1,35 @@
 from dataclasses import dataclass
+from datetime import datetime
+
+from database.rows import Row
 
 
 @dataclass(slots=True)
-class Form:
+class Form(Row):
     id: int
     name: str
     message: str | None
     confirmation: str | None
     channel: int | None
     ping: bool
+    digest: int | None
+    version: int
+    retention: int | None
+    max_responses: int | None
+    cooldown: int | None
 
 
 @dataclass(slots=True)
-class Page:
+class Page(Row):
     id: int
     form_id: int
     label: str
     title: str | None
+    question_count: int
 
 
 @dataclass(slots=True)
-class Question:
+class Question(Row):
     id: int
     page_id: int
     label: str
@@ -31,3 +40,29 @@ class Question:
     min_length: int | None
     max_length: int | None
     minecraft_username: bool
+
+
+@dataclass(slots=True)
+class FormView(Row):
+    id: int
+    message_id: int
+    label: str
+    emoji: str | None
+    style: int
+    form_id: int
+
+
+@dataclass(slots=True)
+class Limits(Row):
+    closed: bool
+    # When the user may submit again, in the past if they already may
+    next_submission: datetime | None
+
+
+@dataclass(slots=True)
+class HistoryEntry(Row):
+    id: int
+    timestamp: datetime
+    form_name: str
+    username: str
+    minecraft_username: str | None
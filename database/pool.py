@@ -0,0 +1,97 @@
+"""Settings of the connection pools, overridable through the environment.
+
+Set FORMBOT_DB_PGBOUNCER=1 when FORMBOT_DB_URL points to PgBouncer in
+transaction pooling mode. Statements are then not prepared by name, as the next
+transaction may run on another server connection, and connections are not reset
+on release, since their server session is not ours to keep. LISTEN needs a
+session, so the listener connects to FORMBOT_DB_LISTEN_URL, directly to Postgres.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import Any
+
+import asyncpg
+
+log = logging.getLogger(__name__)
+
+POOL_MIN = int(os.environ.get("FORMBOT_DB_POOL_MIN", "10"))
+POOL_MAX = int(os.environ.get("FORMBOT_DB_POOL_MAX", "10"))
+# Seconds after which idle connections above the minimum are closed
+POOL_IDLE = float(os.environ.get("FORMBOT_DB_POOL_IDLE", "300"))
+# Seconds a query may run, 0 for no limit
+COMMAND_TIMEOUT = float(os.environ.get("FORMBOT_DB_COMMAND_TIMEOUT", "30"))
+STATEMENT_CACHE = int(os.environ.get("FORMBOT_DB_STATEMENT_CACHE", "100"))
+PGBOUNCER = os.environ.get("FORMBOT_DB_PGBOUNCER") == "1"
+
+WARM_UP_TIMEOUT = 30
+
+
+async def _keep_session(_: asyncpg.Connection) -> None:
+    pass
+
+
+def listen_url(url: str) -> str:
+    """Where the listener connects, FORMBOT_DB_LISTEN_URL or else the pool's URL.
+
+    Raises RuntimeError in PgBouncer mode without it, as notifications would
+    never arrive and cached forms would go stale.
+    """
+    listen = os.environ.get("FORMBOT_DB_LISTEN_URL")
+    if listen is not None:
+        return listen
+    if PGBOUNCER:
+        raise RuntimeError(
+            "FORMBOT_DB_PGBOUNCER=1 requires FORMBOT_DB_LISTEN_URL,"
+            " as LISTEN does not work through transaction pooling"
+        )
+    return url
+
+
+@dataclass(frozen=True, slots=True)
+class PoolProfile:
+    min_size: int = POOL_MIN
+    max_size: int = POOL_MAX
+    max_inactive_lifetime: float = POOL_IDLE
+    command_timeout: float = COMMAND_TIMEOUT
+    statement_cache_size: int = STATEMENT_CACHE
+    pgbouncer: bool = PGBOUNCER
+
+    def options(self) -> dict[str, Any]:
+        """Keyword arguments of asyncpg.create_pool and asyncpg.Pool."""
+        options: dict[str, Any] = {
+            "min_size": self.min_size,
+            "max_size": max(self.min_size, self.max_size),
+            "max_inactive_connection_lifetime": self.max_inactive_lifetime,
+            "command_timeout": self.command_timeout or None,
+            "statement_cache_size": self.statement_cache_size,
+        }
+        if self.pgbouncer:
+            options["statement_cache_size"] = 0
+            options["reset"] = _keep_session
+        return options
+
+
+async def warm_up(pool: asyncpg.Pool, size: int) -> None:
+    """Check `size` connections at once, so none is set up on first use.
+
+    Raises if the database is not usable, which fails the startup.
+    """
+    query = "SELECT 1;"
+
+    start = time.perf_counter()
+    async with asyncio.timeout(WARM_UP_TIMEOUT), AsyncExitStack() as stack:
+        # Held together, so each is a separate connection
+        connections = [
+            await stack.enter_async_context(pool.acquire()) for _ in range(size)
+        ]
+        await asyncio.gather(*(conn.fetchval(query) for conn in connections))
+    log.info(
+        "Warmed up %d connections in %.0f ms",
+        size,
+        (time.perf_counter() - start) * 1000,
+    )
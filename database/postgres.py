@@ -0,0 +1,523 @@
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+import asyncpg
+
+from database.models import Form, FormView, HistoryEntry, Limits, Page, Question
+from database.replica import ReadRouter
+from database.repository import (
+    PARTITIONS_AHEAD,
+    Button,
+    ConflictError,
+    FormTree,
+    LimitError,
+    NotFoundError,
+    Repository,
+)
+
+
+def _like(text: str) -> str:
+    """Escape the wildcards of LIKE, so text matches literally like in memory."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class PostgresRepository(Repository):
+    """Storage in the tables of schema.sql, which enforce its rules.
+
+    Reads go to the replica if one is given, see database/replica.py.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, replica: asyncpg.Pool | None = None) -> None:
+        self.pool = pool
+        self.reads = ReadRouter(pool, replica)
+
+    async def changed(self) -> None:
+        await self.reads.wrote()
+
+    # Forms
+
+    async def form_names(self, prefix: str) -> list[str]:
+        query = "SELECT name FROM forms WHERE name ILIKE $1;"
+
+        return [r["name"] for r in await self.reads.fetch(query, _like(prefix) + "%")]
+
+    async def create_form(self, name: str) -> Form | None:
+        query = (
+            "INSERT INTO forms (name) VALUES ($1)"
+            " ON CONFLICT (name) DO NOTHING"
+            " RETURNING *;"
+        )
+
+        row = await self.pool.fetchrow(query, name)
+        await self.reads.wrote()
+        return None if row is None else Form.from_row(row)
+
+    async def find_form(self, name: str) -> Form | None:
+        query = "SELECT * FROM forms WHERE name = $1;"
+
+        row = await self.reads.fetchrow(query, name)
+        return None if row is None else Form.from_row(row)
+
+    async def form_page(
+        self, search: str, after: str | None, limit: int
+    ) -> list[tuple[int, str]]:
+        query = (
+            "SELECT id, name FROM forms"
+            " WHERE name ILIKE '%' || $1 || '%' AND name > COALESCE($2, '')"
+            " ORDER BY name LIMIT $3;"
+        )
+
+        rows = await self.reads.fetch(query, _like(search), after, limit)
+        return [(r["id"], r["name"]) for r in rows]
+
+    async def update_form(
+        self,
+        form_id: int,
+        name: str,
+        message: str | None,
+        confirmation: str | None,
+        channel: int | None,
+        ping: bool,
+    ) -> bool:
+        query = (
+            "UPDATE forms"
+            " SET name = $1, message = $2, confirmation = $3, channel = $4, ping = $5"
+            " WHERE id = $6 RETURNING id;"
+        )
+
+        try:
+            updated = await self.pool.fetchval(
+                query, name, message, confirmation, channel, ping, form_id
+            )
+        except asyncpg.UniqueViolationError:
+            raise ConflictError from None
+        await self.reads.wrote()
+        return updated is not None
+
+    async def remove_form(self, name: str) -> int | None:
+        query = "DELETE FROM forms WHERE name = $1 RETURNING id;"
+
+        form_id: int | None = await self.pool.fetchval(query, name)
+        await self.reads.wrote()
+        return form_id
+
+    async def set_digest(self, name: str, minutes: int | None) -> bool:
+        query = "UPDATE forms SET digest = $2 WHERE name = $1 RETURNING id;"
+
+        updated = await self.pool.fetchval(query, name, minutes)
+        await self.reads.wrote()
+        return updated is not None
+
+    async def set_retention(self, name: str, months: int | None) -> bool:
+        query = "UPDATE forms SET retention = $2 WHERE name = $1 RETURNING id;"
+
+        updated = await self.pool.fetchval(query, name, months)
+        await self.reads.wrote()
+        return updated is not None
+
+    async def set_limits(
+        self, name: str, max_responses: int | None, cooldown: int | None
+    ) -> bool:
+        query = (
+            "UPDATE forms SET max_responses = $2, cooldown = $3"
+            " WHERE name = $1 RETURNING id;"
+        )
+
+        updated = await self.pool.fetchval(query, name, max_responses, cooldown)
+        await self.reads.wrote()
+        return updated is not None
+
+    async def limits(self, form_id: int, user_id: int) -> Limits | None:
+        # Primary key lookups, the submit transaction checks again on the primary
+        query = (
+            "SELECT coalesce(coalesce(c.responses, 0) >= f.max_responses, FALSE)"
+            " AS closed,"
+            " l.timestamp + make_interval(days => f.cooldown) AS next_submission"
+            " FROM forms f"
+            " LEFT JOIN form_counts c ON c.form_id = f.id"
+            " LEFT JOIN last_submissions l ON l.form_id = f.id AND l.user_id = $2"
+            " WHERE f.id = $1;"
+        )
+
+        row = await self.reads.fetchrow(query, form_id, user_id)
+        return None if row is None else Limits.from_row(row)
+
+    async def import_form(
+        self, definition: dict[str, Any], replace: bool
+    ) -> int | None:
+        query = "SELECT import_form($1::jsonb, $2);"
+
+        form_id: int | None = await self.pool.fetchval(query, definition, replace)
+        await self.reads.wrote()
+        return form_id
+
+    async def export_form(self, name: str) -> dict[str, Any] | None:
+        query = "SELECT export_form($1);"
+
+        definition: dict[str, Any] | None = await self.reads.fetchval(query, name)
+        return definition
+
+    # Pages
+
+    async def page_labels(self, form_id: int, prefix: str) -> list[str]:
+        query = "SELECT label FROM pages WHERE form_id = $1 AND label ILIKE $2;"
+
+        return [
+            r["label"]
+            for r in await self.reads.fetch(query, form_id, _like(prefix) + "%")
+        ]
+
+    async def add_page(self, form_id: int, label: str) -> Page | None:
+        query = (
+            "INSERT INTO pages (form_id, label) VALUES ($1, $2)"
+            " ON CONFLICT (form_id, label) DO NOTHING RETURNING *;"
+        )
+
+        row = await self.pool.fetchrow(query, form_id, label)
+        await self.reads.wrote()
+        return None if row is None else Page.from_row(row)
+
+    async def find_page(self, form_id: int, label: str) -> Page | None:
+        query = "SELECT * FROM pages WHERE form_id = $1 AND label = $2;"
+
+        row = await self.reads.fetchrow(query, form_id, label)
+        return None if row is None else Page.from_row(row)
+
+    async def update_page(self, page_id: int, label: str, title: str | None) -> bool:
+        query = "UPDATE pages SET label = $2, title = $3 WHERE id = $1 RETURNING id;"
+
+        try:
+            updated = await self.pool.fetchval(query, page_id, label, title)
+        except asyncpg.UniqueViolationError:
+            raise ConflictError from None
+        await self.reads.wrote()
+        return updated is not None
+
+    async def remove_page(self, form_id: int, label: str) -> bool:
+        query = "DELETE FROM pages WHERE form_id = $1 AND label = $2 RETURNING id;"
+
+        updated = await self.pool.fetchval(query, form_id, label)
+        await self.reads.wrote()
+        return updated is not None
+
+    # Questions
+
+    async def questions(self, form_id: int) -> list[Question]:
+        query = (
+            "SELECT q.* FROM questions q JOIN pages p ON q.page_id = p.id"
+            " WHERE p.form_id = $1 ORDER BY p.id, q.id;"
+        )
+
+        return Question.from_rows(await self.reads.fetch(query, form_id))
+
+    async def add_question(
+        self, form_id: int, page_label: str | None, label: str
+    ) -> Question | None:
+        query = "SELECT * FROM add_question($1, $2, $3);"
+
+        try:
+            row = await self.pool.fetchrow(query, form_id, page_label, label)
+        except asyncpg.NoDataFoundError:
+            raise NotFoundError from None
+        await self.reads.wrote()
+        return None if row is None else Question.from_row(row)
+
+    async def find_question(self, form_id: int, label: str) -> Question | None:
+        query = (
+            "SELECT q.* FROM questions q JOIN pages p ON q.page_id = p.id"
+            " WHERE p.form_id = $1 AND q.label = $2;"
+        )
+
+        row = await self.reads.fetchrow(query, form_id, label)
+        return None if row is None else Question.from_row(row)
+
+    async def update_question(
+        self,
+        question_id: int,
+        label: str,
+        description: str | None,
+        placeholder: str | None,
+        paragraph: bool,
+        required: bool,
+        min_length: int | None,
+        max_length: int | None,
+        minecraft_username: bool,
+    ) -> bool:
+        query = (
+            "UPDATE questions"
+            " SET label = $2, description = $3, placeholder = $4, paragraph = $5,"
+            " required = $6, min_length = $7, max_length = $8, minecraft_username = $9"
+            " WHERE id = $1 RETURNING id;"
+        )
+
+        try:
+            updated = await self.pool.fetchval(
+                query,
+                question_id,
+                label,
+                description,
+                placeholder,
+                paragraph,
+                required,
+                min_length,
+                max_length,
+                minecraft_username,
+            )
+        except asyncpg.UniqueViolationError:
+            raise ConflictError from None
+        await self.reads.wrote()
+        return updated is not None
+
+    async def remove_question(self, form_id: int, label: str) -> bool:
+        query = (
+            "DELETE FROM questions"
+            " WHERE label = $1 AND page_id IN (SELECT id FROM pages WHERE form_id = $2)"
+            " RETURNING id;"
+        )
+
+        updated = await self.pool.fetchval(query, label, form_id)
+        await self.reads.wrote()
+        return updated is not None
+
+    # Versions
+
+    async def form_version(self, form_id: int) -> int | None:
+        query = "SELECT version FROM forms WHERE id = $1;"
+
+        version: int | None = await self.reads.fetchval(query, form_id)
+        return version
+
+    async def form_tree(self, form_id: int) -> FormTree | None:
+        query_form = "SELECT * FROM forms WHERE id = $1;"
+        query_pages = "SELECT * FROM pages WHERE form_id = $1 ORDER BY id;"
+        query_questions = (
+            "SELECT q.* FROM questions q JOIN pages p ON q.page_id = p.id"
+            " WHERE p.form_id = $1 ORDER BY q.id;"
+        )
+
+        # Repeatable read, so the tree matches the version of the form row. On the
+        # primary, as it is only loaded for a new version to snapshot it there
+        async with (
+            self.pool.acquire() as conn,
+            conn.transaction(isolation="repeatable_read"),
+        ):
+            row = await conn.fetchrow(query_form, form_id)
+            if row is None:
+                return None
+            questions: dict[int, list[Question]] = {}
+            for q in Question.from_rows(await conn.fetch(query_questions, form_id)):
+                questions.setdefault(q.page_id, []).append(q)
+            pages = Page.from_rows(await conn.fetch(query_pages, form_id))
+        return Form.from_row(row), [(p, questions.get(p.id, [])) for p in pages]
+
+    async def snapshot(self, form_id: int, version: int) -> dict[str, Any] | None:
+        query = (
+            "SELECT snapshot FROM form_versions WHERE form_id = $1 AND version = $2;"
+        )
+
+        snapshot: dict[str, Any] | None = await self.reads.fetchval(
+            query, form_id, version
+        )
+        return snapshot
+
+    async def save_snapshot(
+        self, form_id: int, version: int, snapshot: dict[str, Any]
+    ) -> None:
+        query = (
+            "INSERT INTO form_versions (form_id, version, snapshot)"
+            " VALUES ($1, $2, $3) ON CONFLICT DO NOTHING;"
+        )
+
+        await self.pool.execute(query, form_id, version, snapshot)
+
+    # Form views
+
+    async def form_views(self, message_id: int) -> list[FormView]:
+        query = "SELECT * FROM form_views WHERE message_id = $1 ORDER BY id;"
+
+        return FormView.from_rows(await self.reads.fetch(query, message_id))
+
+    async def add_form_views(
+        self, message_ids: list[int], buttons: list[Button]
+    ) -> None:
+        # One statement for all messages, buttons keep their order within each
+        query = (
+            "INSERT INTO form_views (message_id, label, emoji, style, form_id)"
+            " SELECT m, b.label, b.emoji, b.style, b.form_id"
+            " FROM unnest($1::BIGINT[]) AS m,"
+            " unnest($2::VARCHAR[], $3::VARCHAR[], $4::SMALLINT[], $5::SMALLINT[])"
+            " WITH ORDINALITY AS b (label, emoji, style, form_id, i)"
+            " ORDER BY m, b.i;"
+        )
+
+        labels, emojis, styles, form_ids = zip(*buttons, strict=True)
+        await self.pool.execute(query, message_ids, labels, emojis, styles, form_ids)
+
+    async def remove_form_views(self, message_ids: list[int]) -> None:
+        query = "DELETE FROM form_views WHERE message_id = ANY($1::BIGINT[]);"
+
+        await self.pool.execute(query, message_ids)
+
+    async def form_view_messages(self) -> list[int]:
+        query = "SELECT DISTINCT message_id FROM form_views;"
+
+        return [r["message_id"] for r in await self.reads.fetch(query)]
+
+    # Responses
+
+    async def add_response(
+        self,
+        username: str,
+        user_id: int,
+        minecraft_username: str | None,
+        timestamp: datetime,
+        form_id: int,
+        form_version: int,
+        submission: UUID,
+        answers: list[tuple[int, str | None]],
+    ) -> int | None:
+        # Waits on a concurrent insert of the same submission until it ends
+        query_submission = (
+            "INSERT INTO submissions (submission, form_id) VALUES ($1, $2)"
+            " ON CONFLICT DO NOTHING RETURNING form_id;"
+        )
+        query_response = (
+            "INSERT INTO responses"
+            " (username, user_id, minecraft_username, timestamp, form_id,"
+            " form_version, submission)"
+            " VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING id;"
+        )
+        query_answers = (
+            "INSERT INTO answers"
+            " (response_id, form_id, timestamp, question_id, answer)"
+            " VALUES ($1, $2, $3, $4, $5);"
+        )
+        # Only moves the last submission forward once the cooldown has passed.
+        # Without one, an earlier click may commit second and keeps the later.
+        query_last = (
+            "INSERT INTO last_submissions AS l (form_id, user_id, timestamp)"
+            " VALUES ($1, $2, $3)"
+            " ON CONFLICT (form_id, user_id)"
+            " DO UPDATE SET timestamp = greatest(l.timestamp, $3)"
+            " WHERE $4 = 0 OR l.timestamp + make_interval(days => $4) <= $3"
+            " RETURNING form_id;"
+        )
+        query_applicant = (
+            "INSERT INTO applicant_counts AS a (form_id, user_id,"
+            " minecraft_username, month, responses, last)"
+            " VALUES ($1, $2, coalesce(lower($3), ''),"
+            " date_trunc('month', $4::TIMESTAMPTZ), 1, $4)"
+            " ON CONFLICT (form_id, user_id, minecraft_username, month)"
+            " DO UPDATE SET responses = a.responses + 1, last = greatest(a.last, $4);"
+        )
+        query_next = (
+            "SELECT timestamp + make_interval(days => $3) FROM last_submissions"
+            " WHERE form_id = $1 AND user_id = $2;"
+        )
+        # Last, as the row is shared by all submissions of the form until commit
+        query_count = (
+            "INSERT INTO form_counts AS c (form_id, responses) VALUES ($1, 1)"
+            " ON CONFLICT (form_id) DO UPDATE SET responses = c.responses + 1"
+            " RETURNING responses;"
+        )
+        query_form = "SELECT max_responses, cooldown FROM forms WHERE id = $1;"
+        query_partitions = "SELECT create_partitions($1, $2);"
+
+        partitioned = False
+        while True:
+            try:
+                async with self.pool.acquire() as conn, conn.transaction():
+                    key = await conn.fetchval(query_submission, submission, form_id)
+                    if key is None:
+                        return None
+                    response_id: int = await conn.fetchval(
+                        query_response,
+                        username,
+                        user_id,
+                        minecraft_username,
+                        timestamp,
+                        form_id,
+                        form_version,
+                        submission,
+                    )
+                    await conn.executemany(
+                        query_answers,
+                        [(response_id, form_id, timestamp, q, a) for q, a in answers],
+                    )
+                    form = await conn.fetchrow(query_form, form_id)
+                    max_responses, cooldown = (None, 0) if form is None else form
+                    cooldown = cooldown or 0
+                    last = await conn.fetchval(
+                        query_last, form_id, user_id, timestamp, cooldown
+                    )
+                    if last is None:
+                        next_submission = await conn.fetchval(
+                            query_next, form_id, user_id, cooldown
+                        )
+                        raise LimitError(Limits(False, next_submission))
+                    await conn.execute(
+                        query_applicant,
+                        form_id,
+                        user_id,
+                        minecraft_username,
+                        timestamp,
+                    )
+                    responses = await conn.fetchval(query_count, form_id)
+                    if max_responses is not None and responses > max_responses:
+                        raise LimitError(Limits(True, None))
+                return response_id
+            except asyncpg.ForeignKeyViolationError:
+                # The form or its version was removed meanwhile
+                raise NotFoundError from None
+            except asyncpg.CheckViolationError as e:
+                # The month has no partition yet, as maintenance fell behind
+                if partitioned or "no partition" not in str(e):
+                    raise
+                await self.pool.execute(query_partitions, form_id, PARTITIONS_AHEAD)
+                partitioned = True
+
+    async def history_summary(
+        self, user_id: int | None, minecraft_username: str | None
+    ) -> list[tuple[str, int, datetime]]:
+        # Each response is counted in one row, so rows matching both add up right
+        query = (
+            "SELECT f.name, sum(a.responses)::INTEGER, max(a.last) AS last"
+            " FROM applicant_counts a JOIN forms f ON f.id = a.form_id"
+            " WHERE a.user_id = $1 OR a.minecraft_username = lower($2)"
+            " GROUP BY f.name ORDER BY last DESC;"
+        )
+
+        return [
+            (r[0], r[1], r[2])
+            for r in await self.reads.fetch(query, user_id, minecraft_username)
+        ]
+
+    async def history_page(
+        self,
+        user_id: int | None,
+        minecraft_username: str | None,
+        before: tuple[datetime, int] | None,
+        limit: int,
+    ) -> list[HistoryEntry]:
+        query = (
+            "SELECT r.id, r.timestamp, f.name AS form_name, r.username,"
+            " r.minecraft_username"
+            " FROM responses r JOIN forms f ON f.id = r.form_id"
+            " WHERE (r.user_id = $1 OR lower(r.minecraft_username) = lower($2))"
+            " AND (r.timestamp, r.id)"
+            " < (COALESCE($3::timestamptz, 'infinity'), COALESCE($4::integer, 0))"
+            " ORDER BY r.timestamp DESC, r.id DESC LIMIT $5;"
+        )
+
+        timestamp, response_id = before or (None, None)
+        return HistoryEntry.from_rows(
+            await self.reads.fetch(
+                query, user_id, minecraft_username, timestamp, response_id, limit
+            )
+        )
+
+    async def maintain(self, ahead: int) -> list[str]:
+        query = "SELECT maintain_partitions($1);"
+
+        return [r[0] for r in await self.pool.fetch(query, ahead)]
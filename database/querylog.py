@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, cast
+
+import asyncpg
+from asyncpg.connection import LoggedQuery
+from asyncpg.pool import PoolAcquireContext, PoolConnectionProxy
+
+from database.pool import PoolProfile
+
+log = logging.getLogger(__name__)
+
+# Queries slower than this are logged, a sample of them is explained
+SLOW_QUERY_MS = float(os.environ.get("FORMBOT_SLOW_QUERY_MS", "100"))
+EXPLAIN_SAMPLE = float(os.environ.get("FORMBOT_EXPLAIN_SAMPLE", "0.1"))
+PLANS_PATH = Path(os.environ.get("FORMBOT_QUERY_PLANS", "query_plans.jsonl"))
+EXPLAIN_TIMEOUT = 30
+
+# Issuer of the queries and pool wait of the current acquire, in seconds
+_acquired: ContextVar[tuple[str, float] | None] = ContextVar("acquired", default=None)
+_explaining: ContextVar[bool] = ContextVar("explaining", default=False)
+
+
+def _caller() -> str:
+    # The command or view, past the repository and pool frames
+    frame = sys._getframe(2)
+    while frame.f_back is not None and frame.f_globals.get("__name__", "").startswith(
+        ("asyncpg", "database.")
+    ):
+        frame = frame.f_back
+    return f"{frame.f_globals.get('__name__')}:{frame.f_code.co_qualname}"
+
+
+def _shape(arg: object) -> str:
+    if isinstance(arg, str | bytes | list | tuple):
+        return f"{type(arg).__name__}[{len(arg)}]"
+    return type(arg).__name__
+
+
+class TimedAcquireContext(PoolAcquireContext):
+    __slots__ = ("token",)
+
+    async def __aenter__(self) -> PoolConnectionProxy:
+        caller = _caller()
+        start = time.perf_counter()
+        pool = cast("QueryLogPool", self.pool)
+        pool.waiting += 1
+        try:
+            conn = await super().__aenter__()
+        finally:
+            pool.waiting -= 1
+        self.token = _acquired.set((caller, time.perf_counter() - start))
+        return conn
+
+    async def __aexit__(self, *exc: object) -> None:
+        _acquired.reset(self.token)
+        await super().__aexit__(*exc)
+
+
+class QueryLogPool(asyncpg.Pool):
+    # Tasks waiting for a connection, see utils/admission.py
+    waiting = 0
+
+    def acquire(self, *, timeout: float | None = None) -> PoolAcquireContext:
+        return TimedAcquireContext(self, timeout)
+
+
+class QueryLog:
+    """Logs slow queries with their issuer and pool wait.
+
+    A sample of them is re-run with EXPLAIN ANALYZE in a read-only transaction
+    that is rolled back, and the plans are appended to PLANS_PATH as JSON lines.
+    Statements that write are rejected by the transaction and not explained.
+    """
+
+    def __init__(
+        self, init: Callable[[asyncpg.Connection], Awaitable[None]] | None = None
+    ) -> None:
+        self.init = init
+        self.pool: asyncpg.Pool
+        self.pending: set[asyncio.Task[None]] = set()
+
+    async def create_pool(self, dsn: str, profile: PoolProfile) -> QueryLogPool:
+        # Other defaults of asyncpg.create_pool, which has no pool class parameter
+        pool = QueryLogPool(
+            dsn,
+            max_queries=50000,
+            init=self.attach,
+            loop=None,
+            connection_class=asyncpg.Connection,
+            record_class=asyncpg.Record,
+            **profile.options(),
+        )
+        self.pool = pool
+        await pool
+        return pool
+
+    async def attach(self, conn: asyncpg.Connection) -> None:
+        conn.add_query_logger(self.on_query)
+        if self.init is not None:
+            await self.init(conn)
+
+    def on_query(self, record: LoggedQuery) -> None:
+        # Called soon after the query, in a copy of the issuer's context
+        elapsed = record.elapsed * 1000
+        if elapsed < SLOW_QUERY_MS or _explaining.get():
+            return
+        caller, wait = _acquired.get() or ("unknown", 0.0)
+        # executemany passes a list of argument tuples
+        args = record.args if isinstance(record.args, tuple) else ()
+        log.warning(
+            "Slow query (%.0f ms, %.0f ms pool wait) from %s with (%s)%s: %s",
+            elapsed,
+            wait * 1000,
+            caller,
+            ", ".join(map(_shape, args)),
+            f" failing with {type(record.exception).__name__}"
+            if record.exception
+            else "",
+            record.query,
+        )
+        if record.exception is None and random.random() < EXPLAIN_SAMPLE:  # noqa: S311
+            task = asyncio.create_task(self.explain(record, caller, elapsed))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+
+    async def explain(self, record: LoggedQuery, caller: str, elapsed: float) -> None:
+        query = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + record.query
+
+        if not isinstance(record.args, tuple):
+            return
+        _explaining.set(True)
+        try:
+            async with self.pool.acquire() as conn:
+                transaction = conn.transaction(readonly=True)
+                await transaction.start()
+                try:
+                    plan = await conn.fetchval(
+                        query, *record.args, timeout=EXPLAIN_TIMEOUT
+                    )
+                finally:
+                    await transaction.rollback()
+        except (asyncpg.PostgresError, TimeoutError) as e:
+            log.debug("Could not explain query from %s: %s", caller, e)
+            return
+
+        entry: dict[str, Any] = {
+            "time": datetime.now(UTC).isoformat(),
+            "caller": caller,
+            "elapsed_ms": round(elapsed, 1),
+            "query": record.query,
+            "params": [_shape(a) for a in record.args],
+            "plan": json.loads(plan),
+        }
+        await asyncio.to_thread(self.write, json.dumps(entry))
+        log.info("Plan of slow query from %s written to %s", caller, PLANS_PATH)
+
+    def write(self, line: str) -> None:
+        with PLANS_PATH.open("a") as f:
+            f.write(line + "\n")
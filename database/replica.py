@@ -0,0 +1,117 @@
+"""Route reads to a streaming replica of the database, set as FORMBOT_DB_REPLICA_URL.
+
+Reads go to the replica while it is reachable, lags behind by at most
+REPLICA_MAX_LAG and has replayed the latest change this process knows of.
+Otherwise, and when a read on it fails, they go to the primary.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any
+
+import asyncpg
+
+log = logging.getLogger(__name__)
+
+REPLICA_MAX_LAG = float(os.environ.get("FORMBOT_DB_REPLICA_MAX_LAG", "5"))
+REPLICA_CHECK_INTERVAL = 1
+# Time a failed replica is left alone before it is used again
+REPLICA_RETRY = 30
+# The replica being unreachable or interrupting queries, e.g. by a recovery conflict
+REPLICA_ERRORS = (
+    OSError,
+    TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.OperatorInterventionError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.TransactionRollbackError,
+)
+
+
+class ReadRouter:
+    """Picks the pool for each read, the primary unless the replica is fit."""
+
+    def __init__(self, primary: asyncpg.Pool, replica: asyncpg.Pool | None) -> None:
+        self.primary = primary
+        self.replica = replica
+        # WAL positions as bytes since 0/0, of our latest change and the replica
+        self.written = 0
+        self.replayed = -1
+        self.lag = float("inf")
+        self.down_until = 0.0
+        self.task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self.replica is not None:
+            self.task = asyncio.create_task(self.monitor(self.replica))
+
+    @property
+    def pool(self) -> asyncpg.Pool:
+        if (
+            self.replica is None
+            or self.lag > REPLICA_MAX_LAG
+            or self.replayed < self.written
+            or time.monotonic() < self.down_until
+        ):
+            return self.primary
+        return self.replica
+
+    async def wrote(self) -> None:
+        """Read from the primary until the replica has our latest change."""
+        query = "SELECT (pg_current_wal_lsn() - '0/0')::BIGINT;"
+
+        if self.replica is not None:
+            self.written = max(self.written, await self.primary.fetchval(query))
+
+    async def monitor(self, replica: asyncpg.Pool) -> None:
+        # The lag is 0 while all received WAL is replayed, even if that is old
+        query = (
+            "SELECT (pg_last_wal_replay_lsn() - '0/0')::BIGINT,"
+            " CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+            " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END;"
+        )
+
+        lagging = False
+        while True:
+            try:
+                row = await replica.fetchrow(query)
+            except (*REPLICA_ERRORS, asyncpg.PostgresError) as e:
+                self.failed(e)
+            else:
+                if row is None or row[0] is None:
+                    log.error("Replica is not in recovery, reading from the primary")
+                    return
+                self.replayed, self.lag = row[0], float(row[1])
+                if not lagging and self.lag > REPLICA_MAX_LAG:
+                    log.warning(
+                        "Replica lags by %.1f s, reading from the primary", self.lag
+                    )
+                elif lagging and self.lag <= REPLICA_MAX_LAG:
+                    log.info("Replica caught up")
+                lagging = self.lag > REPLICA_MAX_LAG
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+    def failed(self, error: BaseException) -> None:
+        if time.monotonic() >= self.down_until:
+            log.warning("Replica failed, reading from the primary: %r", error)
+        self.down_until = time.monotonic() + REPLICA_RETRY
+
+    async def fetch(self, query: str, *args: object) -> list[asyncpg.Record]:
+        pool = self.pool
+        if pool is self.primary:
+            return await pool.fetch(query, *args)
+        try:
+            return await pool.fetch(query, *args)
+        except REPLICA_ERRORS as e:
+            self.failed(e)
+        return await self.primary.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args: object) -> asyncpg.Record | None:
+        rows = await self.fetch(query, *args)
+        return rows[0] if rows else None
+
+    async def fetchval(self, query: str, *args: object) -> Any:  # noqa: ANN401
+        row = await self.fetchrow(query, *args)
+        return None if row is None else row[0]
@@ -0,0 +1,246 @@
+"""Storage interface of the bot, implemented by database/postgres.py and memory.py.
+
+Both implementations share the semantics of schema.sql: names and labels are
+unique per parent, pages hold up to five questions, removals cascade and every
+change to a form, its pages or questions bumps the form version.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+from database.models import Form, FormView, HistoryEntry, Limits, Page, Question
+
+# Set as FORMBOT_DB_URL to keep everything in memory, lost on restart
+MEMORY_URL = "memory://"
+# Months of response partitions created in advance
+PARTITIONS_AHEAD = 2
+
+FormTree = tuple[Form, list[tuple[Page, list[Question]]]]
+# Label, emoji, style and form ID of a button
+Button = tuple[str, str | None, int, int]
+
+
+class ConflictError(Exception):
+    """A name or label is already taken."""
+
+
+class NotFoundError(Exception):
+    """A referenced row does not exist."""
+
+
+class LimitError(Exception):
+    """A form is full, or the user has to wait before submitting it again."""
+
+    def __init__(self, limits: Limits) -> None:
+        super().__init__(limits)
+        self.limits = limits
+
+
+class Repository(ABC):
+    @abstractmethod
+    async def changed(self) -> None:
+        """Another process changed forms, make the change visible to later reads."""
+
+    # Forms
+
+    @abstractmethod
+    async def form_names(self, prefix: str) -> list[str]: ...
+
+    @abstractmethod
+    async def create_form(self, name: str) -> Form | None:
+        """Returns None if the name is taken."""
+
+    @abstractmethod
+    async def find_form(self, name: str) -> Form | None: ...
+
+    @abstractmethod
+    async def form_page(
+        self, search: str, after: str | None, limit: int
+    ) -> list[tuple[int, str]]:
+        """Ids and names of forms whose name contains `search`, ordered by name.
+
+        Pass the last name of the previous page as `after` for the next one.
+        """
+
+    @abstractmethod
+    async def update_form(
+        self,
+        form_id: int,
+        name: str,
+        message: str | None,
+        confirmation: str | None,
+        channel: int | None,
+        ping: bool,
+    ) -> bool:
+        """Returns False if the form does not exist, raises ConflictError."""
+
+    @abstractmethod
+    async def remove_form(self, name: str) -> int | None: ...
+
+    @abstractmethod
+    async def set_digest(self, name: str, minutes: int | None) -> bool: ...
+
+    @abstractmethod
+    async def set_retention(self, name: str, months: int | None) -> bool: ...
+
+    @abstractmethod
+    async def set_limits(
+        self, name: str, max_responses: int | None, cooldown: int | None
+    ) -> bool: ...
+
+    @abstractmethod
+    async def limits(self, form_id: int, user_id: int) -> Limits | None:
+        """Whether a form is full and when the user may submit it next.
+
+        Reads the counters add_response keeps, returns None for an unknown form.
+        """
+
+    @abstractmethod
+    async def import_form(
+        self, definition: dict[str, Any], replace: bool
+    ) -> int | None:
+        """Create a form from a validated definition, see database/definitions.py.
+
+        Returns the form ID, or None if the form exists and replace is not set.
+        """
+
+    @abstractmethod
+    async def export_form(self, name: str) -> dict[str, Any] | None: ...
+
+    # Pages
+
+    @abstractmethod
+    async def page_labels(self, form_id: int, prefix: str) -> list[str]: ...
+
+    @abstractmethod
+    async def add_page(self, form_id: int, label: str) -> Page | None:
+        """Returns None if the label is taken."""
+
+    @abstractmethod
+    async def find_page(self, form_id: int, label: str) -> Page | None: ...
+
+    @abstractmethod
+    async def update_page(self, page_id: int, label: str, title: str | None) -> bool:
+        """Returns False if the page does not exist, raises ConflictError."""
+
+    @abstractmethod
+    async def remove_page(self, form_id: int, label: str) -> bool: ...
+
+    # Questions
+
+    @abstractmethod
+    async def questions(self, form_id: int) -> list[Question]:
+        """All questions of a form, ordered by page."""
+
+    @abstractmethod
+    async def add_question(
+        self, form_id: int, page_label: str | None, label: str
+    ) -> Question | None:
+        """Add to the page, or to the first with room, created if needed.
+
+        Raises NotFoundError for an unknown page and returns None if the label is
+        taken or the page is full.
+        """
+
+    @abstractmethod
+    async def find_question(self, form_id: int, label: str) -> Question | None: ...
+
+    @abstractmethod
+    async def update_question(
+        self,
+        question_id: int,
+        label: str,
+        description: str | None,
+        placeholder: str | None,
+        paragraph: bool,
+        required: bool,
+        min_length: int | None,
+        max_length: int | None,
+        minecraft_username: bool,
+    ) -> bool:
+        """Returns False if the question does not exist, raises ConflictError."""
+
+    @abstractmethod
+    async def remove_question(self, form_id: int, label: str) -> bool: ...
+
+    # Versions
+
+    @abstractmethod
+    async def form_version(self, form_id: int) -> int | None: ...
+
+    @abstractmethod
+    async def form_tree(self, form_id: int) -> FormTree | None:
+        """The form with its pages and questions, consistent with its version."""
+
+    @abstractmethod
+    async def snapshot(self, form_id: int, version: int) -> dict[str, Any] | None: ...
+
+    @abstractmethod
+    async def save_snapshot(
+        self, form_id: int, version: int, snapshot: dict[str, Any]
+    ) -> None:
+        """Keeps an existing snapshot of the version."""
+
+    # Form views
+
+    @abstractmethod
+    async def form_views(self, message_id: int) -> list[FormView]: ...
+
+    @abstractmethod
+    async def add_form_views(
+        self, message_ids: list[int], buttons: list[Button]
+    ) -> None:
+        """Add the same buttons to each message."""
+
+    @abstractmethod
+    async def remove_form_views(self, message_ids: list[int]) -> None: ...
+
+    @abstractmethod
+    async def form_view_messages(self) -> list[int]:
+        """IDs of the messages that have form views."""
+
+    # Responses
+
+    @abstractmethod
+    async def add_response(
+        self,
+        username: str,
+        user_id: int,
+        minecraft_username: str | None,
+        timestamp: datetime,
+        form_id: int,
+        form_version: int,
+        submission: UUID,
+        answers: list[tuple[int, str | None]],
+    ) -> int | None:
+        """Record a response with its answers to questions by ID.
+
+        Returns None if the submission was already recorded. Raises
+        NotFoundError if the form version has no snapshot and LimitError if the
+        form is full or the user submitted it within its cooldown.
+        """
+
+    @abstractmethod
+    async def history_summary(
+        self, user_id: int | None, minecraft_username: str | None
+    ) -> list[tuple[str, int, datetime]]:
+        """Form name, count and last timestamp of the responses of an applicant.
+
+        Reads counters add_response keeps, as it runs on every submission.
+        """
+
+    @abstractmethod
+    async def history_page(
+        self,
+        user_id: int | None,
+        minecraft_username: str | None,
+        before: tuple[datetime, int] | None,
+        limit: int,
+    ) -> list[HistoryEntry]:
+        """Responses newest first, older than the (timestamp, id) cursor."""
+
+    @abstractmethod
+    async def maintain(self, ahead: int) -> list[str]:
+        """Apply retention, returning the names of dropped partitions."""
@@ -0,0 +1,101 @@
+"""Build the dataclasses of database/models.py from rows by column position.
+
+Unlike `Form(**dict(row))`, this allocates no intermediate dict per row. The
+positions of the fields are resolved once per class and column layout.
+
+Run `python -m database.rows` to compare both.
+"""
+
+import time
+import tracemalloc
+from collections.abc import Callable, Sequence
+from dataclasses import fields
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, Self
+
+import asyncpg
+
+ROWS = 100_000
+
+_getters: dict[tuple[type, tuple[str, ...]], Callable[[asyncpg.Record], Any]] = {}
+
+
+def _getter(cls: type, record: asyncpg.Record) -> Callable[[asyncpg.Record], Any]:
+    columns = tuple(record.keys())
+    getter = _getters.get((cls, columns))
+    if getter is None:
+        names = tuple(f.name for f in fields(cls))
+        missing = set(names) - set(columns)
+        if missing:
+            raise ValueError(f"Columns {missing} missing for {cls.__name__}.")
+        if columns == names:
+            getter = tuple  # Columns in field order, as for SELECT *
+        else:
+            getter = itemgetter(*(columns.index(n) for n in names))
+        _getters[cls, columns] = getter
+    return getter
+
+
+class Row:
+    """Base of the models, which are dataclasses with a field per column."""
+
+    __slots__ = ()
+
+    if TYPE_CHECKING:
+
+        def __init__(self, *args: object) -> None: ...
+
+    @classmethod
+    def from_row(cls, record: asyncpg.Record) -> Self:
+        return cls(*_getter(cls, record)(record))
+
+    @classmethod
+    def from_rows(cls, records: Sequence[asyncpg.Record]) -> list[Self]:
+        """Rows of a single query, which all have the same columns."""
+        if not records:
+            return []
+        getter = _getter(cls, records[0])
+        return [cls(*getter(r)) for r in records]
+
+
+def _measure(label: str, load: Callable[[asyncpg.Record], object]) -> None:
+    # Results are dropped, so the peak is what mapping a row allocates on top
+    records = _records()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for record in records:
+        load(record)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>12}: {elapsed * 1000:7.1f} ms, peak {peak:5d} bytes per row")
+
+
+def _records() -> list[asyncpg.Record]:
+    from asyncpg.protocol import protocol
+
+    from database.models import Form
+
+    names = [f.name for f in fields(Form)]
+    mapping = {name: i for i, name in enumerate(names)}
+    # Records normally come from the protocol, this builds them without a server
+    return [
+        protocol._create_record(  # type: ignore[attr-defined]
+            mapping, (i, f"Form {i}", "Hi", None, 1, False, 5, 1, None, None, None)
+        )
+        for i in range(ROWS)
+    ]
+
+
+def main() -> None:
+    from database.models import Form
+
+    getter = _getter(Form, _records()[0])
+    print(f"Mapping {ROWS} forms")
+    _measure("**dict(row)", lambda r: Form(**dict(r)))
+    # What from_rows does per row, once the column layout is resolved
+    _measure("from_rows", lambda r: Form(*getter(r)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,27 @@
 CREATE TABLE forms
 (
-    id           SMALLSERIAL PRIMARY KEY,
-    name         VARCHAR(45) NOT NULL UNIQUE,
-    message      VARCHAR(2000),
-    confirmation VARCHAR(2000),
-    channel      BIGINT,
-    ping         BOOLEAN     NOT NULL DEFAULT FALSE
+    id            SMALLSERIAL PRIMARY KEY,
+    name          VARCHAR(45) NOT NULL UNIQUE,
+    message       VARCHAR(2000),
+    confirmation  VARCHAR(2000),
+    channel       BIGINT,
+    ping          BOOLEAN     NOT NULL DEFAULT FALSE,
+    digest        SMALLINT,
+    version       INTEGER     NOT NULL DEFAULT 1,
+    retention     SMALLINT,
+    -- Responses after which the form closes and days between those of a user
+    max_responses INTEGER,
+    cooldown      SMALLINT
 );
 
 CREATE TABLE pages
 (
-    id      SMALLSERIAL PRIMARY KEY,
-    form_id SMALLINT    NOT NULL REFERENCES forms ON DELETE CASCADE,
-    label   VARCHAR(80) NOT NULL,
-    title   VARCHAR(45),
+    id             SMALLSERIAL PRIMARY KEY,
+    form_id        SMALLINT    NOT NULL REFERENCES forms ON DELETE CASCADE,
+    label          VARCHAR(80) NOT NULL,
+    title          VARCHAR(45),
+    -- Maintained by the questions_count trigger, a modal holds up to 5 inputs
+    question_count SMALLINT    NOT NULL DEFAULT 0 CHECK (question_count <= 5),
     UNIQUE (form_id, label)
 );
 
@@ -32,21 +40,95 @@ CREATE TABLE questions
     UNIQUE (page_id, label)
 );
 
-CREATE TABLE responses
+-- Immutable snapshot of a form with its pages and questions, one per version.
+-- Written on first use of a version, see utils/templates.py.
+CREATE TABLE form_versions
 (
-    id        SMALLSERIAL PRIMARY KEY,
-    username  VARCHAR(32) NOT NULL,
-    timestamp TIMESTAMPTZ NOT NULL,
-    form_id   SMALLINT    NOT NULL REFERENCES forms ON DELETE CASCADE
+    form_id  SMALLINT    NOT NULL REFERENCES forms ON DELETE CASCADE,
+    version  INTEGER     NOT NULL,
+    snapshot JSONB       NOT NULL,
+    created  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (form_id, version)
 );
-CREATE INDEX idx_responses_form_id ON responses (form_id);
 
+-- Responses and answers are partitioned by form, then by month, so that
+-- retention drops whole partitions. See maintain_partitions() below.
+CREATE TABLE responses
+(
+    id                 SERIAL,
+    username           VARCHAR(32) NOT NULL,
+    user_id            BIGINT      NOT NULL,
+    minecraft_username VARCHAR(16),
+    timestamp          TIMESTAMPTZ NOT NULL,
+    form_id            SMALLINT    NOT NULL REFERENCES forms ON DELETE CASCADE,
+    form_version       INTEGER     NOT NULL,
+    submission         UUID        NOT NULL,
+    PRIMARY KEY (id, form_id, timestamp),
+    FOREIGN KEY (form_id, form_version) REFERENCES form_versions ON DELETE CASCADE
+) PARTITION BY LIST (form_id);
+-- Applicant history, see database/history.py. Minecraft names ignore case.
+CREATE INDEX idx_responses_user_id ON responses (user_id, timestamp DESC, id DESC);
+CREATE INDEX idx_responses_minecraft_username
+    ON responses (lower(minecraft_username), timestamp DESC, id DESC);
+
+-- Question IDs refer to the snapshot of the response's form version, so they
+-- stay meaningful after the question is edited or removed.
 CREATE TABLE answers
 (
-    response_id SMALLINT NOT NULL REFERENCES responses ON DELETE CASCADE,
-    question_id SMALLINT NOT NULL REFERENCES questions ON DELETE SET NULL,
+    response_id INTEGER     NOT NULL,
+    form_id     SMALLINT    NOT NULL,
+    timestamp   TIMESTAMPTZ NOT NULL,
+    question_id SMALLINT    NOT NULL,
     answer      VARCHAR(4000),
-    PRIMARY KEY (response_id, question_id)
+    PRIMARY KEY (response_id, question_id, form_id, timestamp),
+    FOREIGN KEY (response_id, form_id, timestamp) REFERENCES responses ON DELETE CASCADE
+) PARTITION BY LIST (form_id);
+
+-- Counters of the limits on forms, updated by add_response in the transaction
+-- of each response, so that checking a limit reads one row. They outlive the
+-- responses they count, which retention may drop.
+CREATE TABLE form_counts
+(
+    form_id   SMALLINT PRIMARY KEY REFERENCES forms ON DELETE CASCADE,
+    responses INTEGER  NOT NULL
+);
+
+-- Idempotency keys of add_response, one per response. Unpartitioned, as a
+-- unique key on responses would have to include the timestamp. A fill-out
+-- session only retries within seconds, so maintain_partitions() drops keys
+-- after a day.
+CREATE TABLE submissions
+(
+    submission UUID        NOT NULL,
+    form_id    SMALLINT    NOT NULL REFERENCES forms ON DELETE CASCADE,
+    created    TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (submission, form_id)
+);
+
+-- Responses per applicant, form and month, for the history on the submit path,
+-- updated by add_response like form_counts. Reading them costs one index probe
+-- instead of one per partition of responses. Minecraft usernames are lower case,
+-- '' for none. Months past retention are deleted with the partitions.
+CREATE TABLE applicant_counts
+(
+    form_id            SMALLINT    NOT NULL REFERENCES forms ON DELETE CASCADE,
+    user_id            BIGINT      NOT NULL,
+    minecraft_username VARCHAR(16) NOT NULL,
+    month              TIMESTAMPTZ NOT NULL,
+    responses          INTEGER     NOT NULL,
+    last               TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (form_id, user_id, minecraft_username, month)
+);
+CREATE INDEX idx_applicant_counts_user_id ON applicant_counts (user_id);
+CREATE INDEX idx_applicant_counts_minecraft_username
+    ON applicant_counts (minecraft_username);
+
+CREATE TABLE last_submissions
+(
+    form_id   SMALLINT    NOT NULL REFERENCES forms ON DELETE CASCADE,
+    user_id   BIGINT      NOT NULL,
+    timestamp TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (form_id, user_id)
 );
 
 CREATE TABLE form_views
@@ -66,3 +148,327 @@ CREATE EXTENSION IF NOT EXISTS pg_trgm;
 CREATE INDEX idx_forms_name_trgm ON forms USING gin (name gin_trgm_ops);
 CREATE INDEX idx_pages_label_trgm ON pages USING gin (label gin_trgm_ops);
 CREATE INDEX idx_questions_label_trgm ON questions USING gin (label gin_trgm_ops);
+
+-- Every change to a form, its pages or questions publishes a new version.
+CREATE FUNCTION forms_bump_version() RETURNS TRIGGER AS
+$$
+BEGIN
+    IF NEW.version = OLD.version THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER forms_bump_version
+    BEFORE UPDATE ON forms
+    FOR EACH ROW EXECUTE FUNCTION forms_bump_version();
+
+CREATE FUNCTION pages_bump_version() RETURNS TRIGGER AS
+$$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (NEW.label, NEW.title) IS NOT DISTINCT FROM (OLD.label, OLD.title) THEN
+        RETURN NULL;
+    END IF;
+    UPDATE forms SET version = version + 1
+    WHERE id = CASE WHEN TG_OP = 'DELETE' THEN OLD.form_id ELSE NEW.form_id END;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER pages_bump_version
+    AFTER INSERT OR UPDATE OR DELETE ON pages
+    FOR EACH ROW EXECUTE FUNCTION pages_bump_version();
+
+CREATE FUNCTION questions_bump_version() RETURNS TRIGGER AS
+$$
+BEGIN
+    UPDATE forms SET version = version + 1
+    WHERE id = (SELECT form_id FROM pages WHERE id = CASE
+        WHEN TG_OP = 'DELETE' THEN OLD.page_id ELSE NEW.page_id END);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER questions_bump_version
+    AFTER INSERT OR UPDATE OR DELETE ON questions
+    FOR EACH ROW EXECUTE FUNCTION questions_bump_version();
+
+CREATE FUNCTION questions_count() RETURNS TRIGGER AS
+$$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE pages SET question_count = question_count - 1 WHERE id = OLD.page_id;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        UPDATE pages SET question_count = question_count + 1 WHERE id = NEW.page_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER questions_count
+    AFTER INSERT OR DELETE OR UPDATE OF page_id ON questions
+    FOR EACH ROW EXECUTE FUNCTION questions_count();
+
+-- Tell other processes about changes, see database/listener.py. Page and
+-- question changes bump the form version, so they are covered by forms.
+CREATE FUNCTION forms_notify() RETURNS TRIGGER AS
+$$
+BEGIN
+    PERFORM pg_notify('forms_changed', OLD.id::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER forms_notify
+    AFTER UPDATE OR DELETE ON forms
+    FOR EACH ROW EXECUTE FUNCTION forms_notify();
+
+-- Create the partitions of a form for the current and the next `ahead` months,
+-- and for the months since `since` when responses from then are to be stored.
+CREATE FUNCTION create_partitions(
+    form SMALLINT, ahead INTEGER, since TIMESTAMPTZ DEFAULT now()
+) RETURNS VOID AS
+$$
+DECLARE
+    tbl   TEXT;
+    month TIMESTAMPTZ;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY ['responses', 'answers']
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I'
+                    ' FOR VALUES IN (%s) PARTITION BY RANGE (timestamp)',
+                tbl || '_' || form, tbl, form
+            );
+            month := date_trunc('month', least(since, now()));
+            WHILE month <= date_trunc('month', now()) + make_interval(months => ahead)
+                LOOP
+                    EXECUTE format(
+                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I'
+                            ' FOR VALUES FROM (%L) TO (%L)',
+                        tbl || '_' || form || '_' || to_char(month, 'YYYYMM'),
+                        tbl || '_' || form,
+                        month,
+                        month + INTERVAL '1 month'
+                    );
+                    month := month + INTERVAL '1 month';
+                END LOOP;
+        END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create upcoming partitions, detach and drop those past the retention of their
+-- form and drop those of removed forms. Returns the names of dropped tables.
+-- Also expires the idempotency keys of submissions.
+CREATE FUNCTION maintain_partitions(ahead INTEGER) RETURNS SETOF TEXT AS
+$$
+DECLARE
+    form   RECORD;
+    tbl    TEXT;
+    leaf   TEXT;
+    cutoff TEXT;
+BEGIN
+    FOR form IN SELECT id, retention FROM forms
+        LOOP
+            PERFORM create_partitions(form.id, ahead);
+            CONTINUE WHEN form.retention IS NULL;
+
+            -- Keeps at least `retention` full months before the current one
+            cutoff := to_char(
+                date_trunc('month', now()) - make_interval(months => form.retention),
+                'YYYYMM'
+            );
+            DELETE FROM applicant_counts
+            WHERE form_id = form.id
+              AND to_char(month, 'YYYYMM') < cutoff;
+            FOREACH tbl IN ARRAY ARRAY ['answers', 'responses']
+                LOOP
+                    FOR leaf IN
+                        SELECT c.relname
+                        FROM pg_inherits i
+                                 JOIN pg_class c ON c.oid = i.inhrelid
+                        WHERE i.inhparent = to_regclass(tbl || '_' || form.id)
+                          AND right(c.relname, 6) < cutoff
+                        LOOP
+                            EXECUTE format(
+                                'ALTER TABLE %I DETACH PARTITION %I',
+                                tbl || '_' || form.id, leaf
+                            );
+                            EXECUTE format('DROP TABLE %I', leaf);
+                            RETURN NEXT leaf;
+                        END LOOP;
+                END LOOP;
+        END LOOP;
+
+    -- Rows of removed forms are already gone through ON DELETE CASCADE
+    FOR leaf IN
+        SELECT c.relname
+        FROM pg_inherits i
+                 JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent IN ('answers'::REGCLASS, 'responses'::REGCLASS)
+          AND NOT EXISTS (
+            SELECT FROM forms WHERE id = split_part(c.relname, '_', 2)::SMALLINT
+        )
+        ORDER BY c.relname
+        LOOP
+            EXECUTE format('DROP TABLE %I', leaf);
+            RETURN NEXT leaf;
+        END LOOP;
+
+    DELETE FROM submissions WHERE created < now() - INTERVAL '1 day';
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the current month, so that a new form takes responses at once. The bot
+-- creates PARTITIONS_AHEAD months in advance, see database/repository.py.
+CREATE FUNCTION forms_create_partitions() RETURNS TRIGGER AS
+$$
+BEGIN
+    PERFORM create_partitions(NEW.id, 0);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER forms_create_partitions
+    AFTER INSERT ON forms
+    FOR EACH ROW EXECUTE FUNCTION forms_create_partitions();
+
+-- Create a form with its pages and questions from a definition, see
+-- database/definitions.py. Replaces the pages and questions of an existing form
+-- with the same name if `overwrite` is set, otherwise returns NULL for it.
+CREATE FUNCTION import_form(definition JSONB, overwrite BOOLEAN) RETURNS SMALLINT AS
+$$
+DECLARE
+    new_id SMALLINT;
+BEGIN
+    INSERT INTO forms (name, message, confirmation, channel, ping, digest, retention,
+                       max_responses, cooldown)
+    SELECT f.name, f.message, f.confirmation, f.channel, coalesce(f.ping, FALSE),
+           f.digest, f.retention, f.max_responses, f.cooldown
+    FROM jsonb_to_record(definition) AS f (
+        name VARCHAR(45), message VARCHAR(2000), confirmation VARCHAR(2000),
+        channel BIGINT, ping BOOLEAN, digest SMALLINT, retention SMALLINT,
+        max_responses INTEGER, cooldown SMALLINT
+    )
+    ON CONFLICT (name) DO UPDATE
+        SET message       = excluded.message,
+            confirmation  = excluded.confirmation,
+            channel       = excluded.channel,
+            ping          = excluded.ping,
+            digest        = excluded.digest,
+            retention     = excluded.retention,
+            max_responses = excluded.max_responses,
+            cooldown      = excluded.cooldown
+    WHERE overwrite
+    RETURNING id INTO new_id;
+
+    IF new_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+    DELETE FROM pages WHERE form_id = new_id;
+
+    WITH page AS (
+        INSERT INTO pages (form_id, label, title)
+        SELECT new_id, p.label, p.title
+        FROM jsonb_array_elements(coalesce(definition -> 'pages', '[]'))
+                 WITH ORDINALITY AS e(page, n),
+             jsonb_to_record(e.page) AS p (label VARCHAR(80), title VARCHAR(45))
+        ORDER BY e.n
+        RETURNING id, label
+    )
+    INSERT INTO questions (page_id, label, description, placeholder, paragraph,
+                           required, min_length, max_length, minecraft_username)
+    SELECT page.id, q.label, q.description, q.placeholder, coalesce(q.paragraph, FALSE),
+           coalesce(q.required, TRUE), q.min_length, q.max_length,
+           coalesce(q.minecraft_username, FALSE)
+    FROM jsonb_array_elements(coalesce(definition -> 'pages', '[]')) AS e(page)
+             JOIN page ON page.label = e.page ->> 'label'
+             CROSS JOIN jsonb_array_elements(coalesce(e.page -> 'questions', '[]'))
+        WITH ORDINALITY AS qe(question, n)
+             CROSS JOIN jsonb_to_record(qe.question) AS q (
+        label VARCHAR(45), description VARCHAR(100), placeholder VARCHAR(100),
+        paragraph BOOLEAN, required BOOLEAN, min_length SMALLINT, max_length SMALLINT,
+        minecraft_username BOOLEAN
+        )
+    ORDER BY page.id, qe.n;
+
+    RETURN new_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The definition of a form, the inverse of import_form().
+CREATE FUNCTION export_form(form_name VARCHAR) RETURNS JSONB AS
+$$
+SELECT to_jsonb(f) - 'id' - 'version' || jsonb_build_object(
+    'pages', coalesce((
+        SELECT jsonb_agg(
+            jsonb_build_object(
+                'label', p.label,
+                'title', p.title,
+                'questions', coalesce((
+                    SELECT jsonb_agg(to_jsonb(q) - 'id' - 'page_id' ORDER BY q.id)
+                    FROM questions q
+                    WHERE q.page_id = p.id
+                ), '[]')
+            ) ORDER BY p.id
+        )
+        FROM pages p
+        WHERE p.form_id = f.id
+    ), '[]')
+)
+FROM forms f
+WHERE f.name = form_name;
+$$ LANGUAGE sql STABLE;
+
+-- Add a question to the page with the given label, or to the first page with
+-- room for it, which is created if needed. Raises no_data_found for an unknown
+-- page and returns no row if the label is taken or the page is full.
+CREATE FUNCTION add_question(form SMALLINT, page_label VARCHAR, question_label VARCHAR)
+    RETURNS SETOF questions AS
+$$
+DECLARE
+    target SMALLINT;
+    n      INTEGER;
+BEGIN
+    IF page_label IS NOT NULL THEN
+        SELECT id INTO target FROM pages WHERE form_id = form AND label = page_label;
+        IF target IS NULL THEN
+            RAISE no_data_found;
+        END IF;
+    ELSE
+        SELECT id INTO target
+        FROM pages
+        WHERE form_id = form AND question_count < 5
+        ORDER BY id
+        LIMIT 1;
+        IF target IS NULL THEN
+            SELECT count(*) INTO n FROM pages WHERE form_id = form;
+            LOOP
+                n := n + 1;
+                INSERT INTO pages (form_id, label)
+                VALUES (form, 'Page ' || n)
+                ON CONFLICT (form_id, label) DO NOTHING
+                RETURNING id INTO target;
+                EXIT WHEN target IS NOT NULL;
+                -- Taken by a page of the user or by a concurrent insert of
+                -- this one, which is only joined while it has room
+                SELECT id INTO target
+                FROM pages
+                WHERE form_id = form AND label = 'Page ' || n AND question_count < 5;
+                EXIT WHEN target IS NOT NULL;
+            END LOOP;
+        END IF;
+    END IF;
+
+    RETURN QUERY
+        INSERT INTO questions (page_id, label)
+        VALUES (target, question_label)
+        ON CONFLICT (page_id, label) DO NOTHING
+        RETURNING *;
+EXCEPTION
+    WHEN check_violation THEN
+        RETURN;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,116 @@
+"""Slots and queueing of utils.admission, driven by stub interactions."""
+
+import asyncio
+from typing import cast
+
+import discord
+import pytest
+
+from utils import admission
+from utils.admission import BUSY_MESSAGE, Admission, Priority
+
+
+class StubResponse:
+    def __init__(self) -> None:
+        self.done = False
+
+    def is_done(self) -> bool:
+        return self.done
+
+    async def defer(self, **_: object) -> None:
+        self.done = True
+
+
+class StubFollowup:
+    def __init__(self) -> None:
+        self.sent: list[str | None] = []
+
+    async def send(self, *, embed: discord.Embed, **_: object) -> None:
+        self.sent.append(embed.description)
+
+
+class StubUser:
+    name = "user"
+
+
+class StubInteraction:
+    def __init__(self) -> None:
+        self.user = StubUser()
+        self.response = StubResponse()
+        self.followup = StubFollowup()
+
+
+def _interaction() -> tuple[discord.Interaction, StubInteraction]:
+    stub = StubInteraction()
+    return cast("discord.Interaction", stub), stub
+
+
+def test_runs_while_slots_are_free() -> None:
+    async def main() -> None:
+        gate = Admission(lambda: 0, slots=1)
+        interaction, stub = _interaction()
+        async with gate.admit(interaction, Priority.QUERY) as admitted:
+            assert admitted
+            assert gate.free == 0
+        assert gate.free == 1
+        assert not stub.response.done
+
+    asyncio.run(main())
+
+
+def test_queue_goes_by_priority() -> None:
+    async def main() -> list[Priority]:
+        gate = Admission(lambda: 0, slots=1)
+        order: list[Priority] = []
+
+        async def wait(priority: Priority) -> None:
+            async with gate.admit(_interaction()[0], priority) as admitted:
+                assert admitted
+                order.append(priority)
+
+        assert await gate.acquire(_interaction()[0], Priority.QUERY, True)
+        waiting = [asyncio.create_task(wait(p)) for p in sorted(Priority, reverse=True)]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*waiting)
+        assert gate.free == 1
+        return order
+
+    assert asyncio.run(main()) == [Priority.SUBMIT, Priority.START, Priority.QUERY]
+
+
+def test_timeout_rejects(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(admission, "QUEUE_TIMEOUT", 0.01)
+
+    async def main() -> None:
+        gate = Admission(lambda: 0, slots=1)
+        assert await gate.acquire(_interaction()[0], Priority.QUERY, True)
+        interaction, stub = _interaction()
+        assert not await gate.acquire(interaction, Priority.QUERY, True)
+        assert stub.followup.sent == [BUSY_MESSAGE]
+        gate.release()
+        assert gate.free == 1
+
+    asyncio.run(main())
+
+
+def test_timeout_after_grant_gives_slot_back(monkeypatch: pytest.MonkeyPatch) -> None:
+    gate = Admission(lambda: 0, slots=1)
+
+    async def wait_for(future: asyncio.Future[None], timeout: float) -> None:  # noqa: ARG001
+        # The slot is granted in the same iteration as the wait times out
+        gate.release()
+        assert future.done()
+        raise TimeoutError
+
+    monkeypatch.setattr(asyncio, "wait_for", wait_for)
+
+    async def main() -> None:
+        assert await gate.acquire(_interaction()[0], Priority.QUERY, True)
+        interaction, stub = _interaction()
+        assert not await gate.acquire(interaction, Priority.SUBMIT, True)
+        assert stub.followup.sent == [BUSY_MESSAGE]
+        assert gate.free == 1
+        assert not gate.queue
+
+    asyncio.run(main())
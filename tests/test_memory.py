@@ -0,0 +1,170 @@
+"""Repository semantics, as MemoryRepository implements them like schema.sql."""
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+from typing import Any
+from uuid import UUID, uuid4
+
+import pytest
+
+from database.memory import MemoryRepository
+from database.models import Form
+from database.repository import LimitError
+
+NOW = datetime(2026, 1, 15, 12, tzinfo=UTC)
+
+
+@pytest.fixture
+def repo() -> MemoryRepository:
+    return MemoryRepository()
+
+
+def _form(
+    repo: MemoryRepository,
+    max_responses: int | None = None,
+    cooldown: int | None = None,
+) -> Form:
+    async def main() -> Form:
+        await repo.create_form("Apply")
+        await repo.set_limits("Apply", max_responses, cooldown)
+        form = await repo.find_form("Apply")
+        assert form is not None
+        await repo.save_snapshot(form.id, form.version, {})
+        return form
+
+    return asyncio.run(main())
+
+
+def _respond(
+    repo: MemoryRepository,
+    form: Form,
+    user_id: int = 1,
+    timestamp: datetime = NOW,
+    submission: UUID | None = None,
+) -> int | None:
+    return asyncio.run(
+        repo.add_response(
+            f"user{user_id}",
+            user_id,
+            None,
+            timestamp,
+            form.id,
+            form.version,
+            submission or uuid4(),
+            [],
+        )
+    )
+
+
+def test_max_responses(repo: MemoryRepository) -> None:
+    form = _form(repo, max_responses=2)
+    assert _respond(repo, form, user_id=1) is not None
+    assert _respond(repo, form, user_id=2) is not None
+
+    with pytest.raises(LimitError) as e:
+        _respond(repo, form, user_id=3)
+    assert e.value.limits.closed
+    assert len(repo.responses) == 2
+    limits = asyncio.run(repo.limits(form.id, 3))
+    assert limits is not None
+    assert limits.closed
+
+
+def test_cooldown(repo: MemoryRepository) -> None:
+    form = _form(repo, cooldown=1)
+    assert _respond(repo, form) is not None
+
+    with pytest.raises(LimitError) as e:
+        _respond(repo, form, timestamp=NOW + timedelta(hours=12))
+    assert not e.value.limits.closed
+    assert e.value.limits.next_submission == NOW + timedelta(days=1)
+    # Other users are not held back
+    assert _respond(repo, form, user_id=2, timestamp=NOW) is not None
+    assert _respond(repo, form, timestamp=NOW + timedelta(days=1)) is not None
+    limits = asyncio.run(repo.limits(form.id, 1))
+    assert limits is not None
+    assert limits.next_submission == NOW + timedelta(days=2)
+
+
+def test_out_of_order_without_cooldown(repo: MemoryRepository) -> None:
+    form = _form(repo)
+    assert _respond(repo, form) is not None
+
+    # A session whose Send click came first may be recorded second
+    assert _respond(repo, form, timestamp=NOW - timedelta(seconds=2)) is not None
+    assert repo.last_submissions[form.id, 1] == NOW
+
+
+def test_duplicate_submission(repo: MemoryRepository) -> None:
+    form = _form(repo, max_responses=5, cooldown=1)
+    submission = uuid4()
+    assert _respond(repo, form, submission=submission) is not None
+
+    # A retry, even later, records nothing and counts against no limit
+    later = NOW + timedelta(minutes=1)
+    assert _respond(repo, form, timestamp=later, submission=submission) is None
+    assert len(repo.responses) == 1
+    assert repo.counts[form.id] == 1
+
+    # Keys expire once no session can retry anymore
+    repo.submissions[submission, form.id] -= timedelta(days=2)
+    asyncio.run(repo.maintain(0))
+    assert not repo.submissions
+
+
+def test_page_auto_assign(repo: MemoryRepository) -> None:
+    form = _form(repo)
+
+    async def main() -> list[tuple[str, int]]:
+        # A full page already named like the next one to create
+        await repo.add_page(form.id, "Page 2")
+        for i in range(5):
+            await repo.add_question(form.id, "Page 2", f"Taken {i}")
+        for i in range(7):
+            assert await repo.add_question(form.id, None, f"Question {i}")
+        return [(p.label, p.question_count) for p in repo._form_pages(form.id)]
+
+    assert asyncio.run(main()) == [("Page 2", 5), ("Page 3", 5), ("Page 4", 2)]
+
+
+def test_import_export_round_trip(repo: MemoryRepository) -> None:
+    question: dict[str, Any] = {
+        "label": "Name",
+        "description": None,
+        "placeholder": "Steve",
+        "paragraph": False,
+        "required": True,
+        "min_length": 3,
+        "max_length": 16,
+        "minecraft_username": True,
+    }
+    definition: dict[str, Any] = {
+        "name": "Apply",
+        "message": "Fill out the form",
+        "confirmation": None,
+        "channel": 1234,
+        "ping": True,
+        "digest": None,
+        "retention": 12,
+        "max_responses": 100,
+        "cooldown": 7,
+        "pages": [
+            {"label": "About you", "title": "About", "questions": [question]},
+            {"label": "Empty", "title": None, "questions": []},
+        ],
+    }
+
+    form_id = asyncio.run(repo.import_form(definition, replace=False))
+    assert form_id is not None
+    assert asyncio.run(repo.export_form("Apply")) == definition
+    assert asyncio.run(repo.import_form(definition, replace=False)) is None
+    assert asyncio.run(repo.import_form(definition, replace=True)) == form_id
+    assert asyncio.run(repo.export_form("Apply")) == definition
+
+
+def test_wildcards_match_literally(repo: MemoryRepository) -> None:
+    asyncio.run(repo.create_form("100% done"))
+    asyncio.run(repo.create_form("1000 done"))
+
+    assert asyncio.run(repo.form_names("100%")) == ["100% done"]
+    assert asyncio.run(repo.form_page("0_d", None, 10)) == []
@@ -0,0 +1,143 @@
+"""Admission control for interactions that need the database.
+
+Work that hits the database takes one of SLOTS. While slots are free and the
+bot keeps up, it runs right away. Otherwise the interaction is deferred at once,
+so it does not miss Discord's 3 second deadline, and waits for a slot in order
+of priority. Cheap paths like autocomplete are shed while the bot is overloaded,
+and users get a busy message instead of a failed interaction.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from itertools import count
+
+import discord
+
+from utils.responses import respond_error
+
+log = logging.getLogger(__name__)
+
+SLOTS = int(os.environ.get("FORMBOT_ADMISSION_SLOTS", "10"))
+# Overloaded past this many tasks waiting for a connection or this loop lag
+MAX_POOL_WAITERS = int(os.environ.get("FORMBOT_MAX_POOL_WAITERS", "10"))
+MAX_LOOP_LAG_MS = float(os.environ.get("FORMBOT_MAX_LOOP_LAG_MS", "250"))
+# Deferred work waiting longer than this, or beyond this many, is rejected
+QUEUE_TIMEOUT = 10
+MAX_QUEUE = 200
+LAG_INTERVAL = 0.1
+
+BUSY_MESSAGE = "The bot is busy right now, please try again in a moment."
+
+
+class Priority(IntEnum):
+    """Lower goes first. A submission holds answers the user already typed."""
+
+    SUBMIT = 0
+    START = 1
+    QUERY = 2
+
+
+class Admission:
+    def __init__(self, pool_waiters: Callable[[], int], slots: int = SLOTS) -> None:
+        self.pool_waiters = pool_waiters
+        self.free = slots
+        self.queue: list[tuple[int, int, asyncio.Future[None]]] = []
+        self.order = count()
+        self.lag = 0.0
+        self.shed = 0
+        self.task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.monitor())
+
+    async def monitor(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag = time.perf_counter() - start - LAG_INTERVAL
+
+    @property
+    def overloaded(self) -> bool:
+        return (
+            self.pool_waiters() > MAX_POOL_WAITERS or self.lag * 1000 > MAX_LOOP_LAG_MS
+        )
+
+    def shedding(self) -> bool:
+        """Whether to skip cheap, optional work like autocomplete."""
+        if self.overloaded:
+            self.shed += 1
+            if self.shed % 100 == 1:
+                log.warning("Overloaded, shed %d requests so far", self.shed)
+            return True
+        return False
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        interaction: discord.Interaction,
+        priority: Priority,
+        *,
+        thinking: bool = True,
+    ) -> AsyncIterator[bool]:
+        """Hold a slot, yielding False if the user was told to try again.
+
+        Set `thinking` to False for components that edit their message, so
+        deferring does not send a new one.
+        """
+        if not await self.acquire(interaction, priority, thinking):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.release()
+
+    async def acquire(
+        self, interaction: discord.Interaction, priority: Priority, thinking: bool
+    ) -> bool:
+        if self.free > 0 and not self.queue and not self.overloaded:
+            self.free -= 1
+            return True
+        if len(self.queue) >= MAX_QUEUE:
+            log.warning(
+                "Rejected %s of %s, queue full", priority.name, interaction.user
+            )
+            await respond_error(interaction, BUSY_MESSAGE)
+            return False
+
+        await interaction.response.defer(ephemeral=True, thinking=thinking)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self.order), future))
+        self.wake()
+        try:
+            await asyncio.wait_for(future, QUEUE_TIMEOUT)
+        except (TimeoutError, asyncio.CancelledError) as e:
+            self.forfeit(future)
+            if not isinstance(e, TimeoutError):
+                raise
+            log.warning("Rejected %s of %s, timed out", priority.name, interaction.user)
+            await respond_error(interaction, BUSY_MESSAGE)
+            return False
+        return True
+
+    def forfeit(self, future: asyncio.Future[None]) -> None:
+        """Give back the slot wake() granted as the wait ended, if it did."""
+        if future.done() and not future.cancelled():
+            self.release()
+
+    def release(self) -> None:
+        self.free += 1
+        self.wake()
+
+    def wake(self) -> None:
+        while self.free > 0 and self.queue:
+            _, _, future = heapq.heappop(self.queue)
+            if not future.done():  # Not timed out
+                self.free -= 1
+                future.set_result(None)
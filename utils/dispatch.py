@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import discord
+
+from database.models import Form
+from utils.embeds import MAX_EMBEDS, MAX_TOTAL
+
+log = logging.getLogger(__name__)
+
+# Sends failing with a server error are retried with growing delays
+SEND_ATTEMPTS = 3
+RETRY_DELAY = 5
+
+Channel = discord.TextChannel | discord.Thread
+
+
+@dataclass(slots=True)
+class Delivery:
+    ping: bool
+    messages: list[list[discord.Embed]]
+    on_sent: Callable[[discord.Message], None] | None = None
+    attempts: int = 0
+
+
+class Dispatcher:
+    """Queue result messages per channel and send them from one worker each.
+
+    discord.py already waits out the rate limit reported in the response headers
+    of each request, so one sequential worker per channel paces sends to that
+    channel's bucket. Responses that queue up meanwhile are coalesced into as few
+    messages as the embed limits allow. Batches that fail for a reason other than
+    missing access are put back and retried.
+    """
+
+    def __init__(self) -> None:
+        self.queues: dict[int, deque[Delivery]] = {}
+        self.workers: dict[int, asyncio.Task[None]] = {}
+        self.digests: dict[tuple[int, int], list[str]] = {}
+        self.digest_tasks: dict[tuple[int, int], asyncio.Task[None]] = {}
+
+    def send(
+        self, channel: Channel, messages: list[list[discord.Embed]], *, ping: bool
+    ) -> None:
+        self._enqueue(channel, Delivery(ping, messages))
+
+    def digest(
+        self,
+        channel: Channel,
+        form: Form,
+        title: str,
+        messages: list[list[discord.Embed]],
+    ) -> None:
+        """Send a response without ping and list it in the next digest of the form."""
+
+        def on_sent(message: discord.Message) -> None:
+            sent_at = discord.utils.format_dt(message.created_at, "R")
+            line = f"[{title}]({message.jump_url}) {sent_at}"
+            self.digests.setdefault((channel.id, form.id), []).append(line)
+            self._schedule_digest(channel, form)
+
+        self._enqueue(channel, Delivery(False, messages, on_sent))
+
+    def _enqueue(self, channel: Channel, delivery: Delivery) -> None:
+        self.queues.setdefault(channel.id, deque()).append(delivery)
+        if channel.id not in self.workers:
+            self.workers[channel.id] = asyncio.create_task(self._work(channel))
+
+    async def _work(self, channel: Channel) -> None:
+        queue = self.queues[channel.id]
+        try:
+            while queue:
+                batch = self._next_batch(queue)
+                try:
+                    await self._send(channel, queue, batch)
+                except Exception:
+                    log.exception(
+                        "Dropped %d response(s) to channel %d", len(batch), channel.id
+                    )
+        finally:
+            del self.queues[channel.id]
+            del self.workers[channel.id]
+
+    @staticmethod
+    def _next_batch(queue: deque[Delivery]) -> list[Delivery]:
+        """Take the next delivery, with the single messages that fit after it."""
+        batch = [queue.popleft()]
+        if len(batch[0].messages) != 1:
+            return batch
+        embeds = list(batch[0].messages[0])
+        size = sum(len(e) for e in embeds)
+        while queue and len(queue[0].messages) == 1:
+            extra = queue[0].messages[0]
+            extra_size = sum(len(e) for e in extra)
+            if len(embeds) + len(extra) > MAX_EMBEDS or size + extra_size > MAX_TOTAL:
+                break
+            batch.append(queue.popleft())
+            embeds.extend(extra)
+            size += extra_size
+        return batch
+
+    async def _send(
+        self, channel: Channel, queue: deque[Delivery], batch: list[Delivery]
+    ) -> None:
+        if len(batch) == 1:
+            messages = batch[0].messages
+        else:
+            messages = [[e for d in batch for e in d.messages[0]]]
+        ping = any(d.ping for d in batch)
+        sent: list[discord.Message] = []
+        try:
+            for i, embeds in enumerate(messages):
+                sent.append(
+                    await channel.send(
+                        "@everyone" if ping and i == 0 else None, embeds=embeds
+                    )
+                )
+        except discord.HTTPException as e:
+            attempts = max(d.attempts for d in batch) + 1
+            if isinstance(e, discord.Forbidden | discord.NotFound) or (
+                attempts >= SEND_ATTEMPTS
+            ):
+                log.warning(
+                    "Dropped %d response(s) to channel %d: %s",
+                    len(batch),
+                    channel.id,
+                    e,
+                )
+                return
+            log.warning(
+                "Failed to send %d response(s) to channel %d, retrying: %s",
+                len(batch),
+                channel.id,
+                e,
+            )
+            if sent:
+                # Only a delivery of several messages is sent in parts
+                self._notify(batch, sent[0])
+                batch[0].messages = messages[len(sent) :]
+                batch[0].ping = False
+            for delivery in batch:
+                delivery.attempts = attempts
+            queue.extendleft(reversed(batch))
+            await asyncio.sleep(RETRY_DELAY * 2 ** (attempts - 1))
+            return
+        self._notify(batch, sent[0])
+
+    @staticmethod
+    def _notify(batch: list[Delivery], message: discord.Message) -> None:
+        for delivery in batch:
+            if delivery.on_sent is not None:
+                delivery.on_sent(message)
+                delivery.on_sent = None
+
+    def _schedule_digest(self, channel: Channel, form: Form) -> None:
+        key = (channel.id, form.id)
+        if key not in self.digest_tasks:
+            self.digest_tasks[key] = asyncio.create_task(
+                self._post_digest(channel, form)
+            )
+
+    async def _post_digest(self, channel: Channel, form: Form) -> None:
+        key = (channel.id, form.id)
+        await asyncio.sleep((form.digest or 0) * 60)
+        del self.digest_tasks[key]
+        lines = self.digests.pop(key, [])
+        if not lines:
+            return
+
+        description = ""
+        for i, line in enumerate(lines):
+            more = f"\n… and {len(lines) - i} more"
+            if len(description) + len(line) + 1 + len(more) > 4096:
+                description += more
+                break
+            description += f"\n{line}"
+        embed = discord.Embed(
+            color=0x859900,
+            title=f"{form.name:.200} - {len(lines)} new response(s)",
+            description=description.strip(),
+        )
+        self._enqueue(channel, Delivery(form.ping, [[embed]]))
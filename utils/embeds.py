@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import discord
+
+# Discord embed limits, MAX_TOTAL applies to all embeds of a message combined
+MAX_EMBEDS = 10
+MAX_FIELDS = 25
+MAX_TOTAL = 6000
+MAX_TITLE = 256
+MAX_NAME = 256
+MAX_VALUE = 1024
+
+Field = tuple[str, str, bool]
+
+
+def split_field(name: str, value: str, inline: bool) -> list[Field]:
+    """Split a field whose value is too long into unnamed continuation fields."""
+    name = name[:MAX_NAME]
+    if len(value) <= MAX_VALUE:
+        return [(name, value, inline)]
+    return [
+        (name if i == 0 else "", value[i : i + MAX_VALUE], False)
+        for i in range(0, len(value), MAX_VALUE)
+    ]
+
+
+def pack_embeds(
+    title: str, color: int, timestamp: datetime, fields: list[Field]
+) -> list[list[discord.Embed]]:
+    """Pack fields into as few messages of up to ten embeds each as possible.
+
+    The title goes on the first embed and the timestamp on the last one.
+    """
+    title = title[:MAX_TITLE]
+    messages: list[list[discord.Embed]] = [[discord.Embed(color=color, title=title)]]
+    size = len(title)
+
+    split_fields = [f for field in fields for f in split_field(*field)]
+    for name, value, inline in split_fields:
+        length = len(name) + len(value)
+        embeds = messages[-1]
+        if size + length > MAX_TOTAL:
+            messages.append([discord.Embed(color=color)])
+            size = 0
+        elif len(embeds[-1].fields) >= MAX_FIELDS:
+            if len(embeds) < MAX_EMBEDS:
+                embeds.append(discord.Embed(color=color))
+            else:
+                messages.append([discord.Embed(color=color)])
+                size = 0
+        messages[-1][-1].add_field(name=name, value=value, inline=inline)
+        size += length
+
+    messages[-1][-1].timestamp = timestamp
+    return messages
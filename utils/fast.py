@@ -0,0 +1,165 @@
+"""Opt-in fast runtime, enabled by setting FORMBOT_FAST=1.
+
+Runs the event loop on uvloop and encodes JSON with orjson, for the Wynncraft
+API and the JSON columns of asyncpg. Either falls back to the standard library
+if not installed. discord.py itself uses orjson whenever it is installed.
+
+Run `python -m utils.fast` to compare both modes.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import UTC, datetime
+from types import ModuleType
+from typing import Any
+
+import asyncpg
+import discord
+
+from utils.embeds import pack_embeds
+
+log = logging.getLogger(__name__)
+
+FAST = os.environ.get("FORMBOT_FAST") == "1"
+
+
+def _optional(name: str) -> ModuleType | None:
+    if not FAST:
+        return None
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+_orjson = _optional("orjson")
+_uvloop = _optional("uvloop")
+
+
+def dumps(obj: object) -> str:
+    if _orjson is not None:
+        return str(_orjson.dumps(obj).decode())
+    return json.dumps(obj)
+
+
+def loads(data: str | bytes) -> Any:  # noqa: ANN401
+    if _orjson is not None:
+        return _orjson.loads(data)
+    return json.loads(data)
+
+
+def install() -> None:
+    """Use uvloop for event loops created from now on, if enabled."""
+    if not FAST:
+        return
+    if _uvloop is not None:
+        asyncio.set_event_loop_policy(_uvloop.EventLoopPolicy())
+    log.info(
+        "Fast mode with %s event loop and %s JSON",
+        "uvloop" if _uvloop is not None else "asyncio",
+        "orjson" if _orjson is not None else "stdlib",
+    )
+
+
+async def set_json_codecs(conn: asyncpg.Connection) -> None:
+    """Exchange JSON and JSONB columns as Python objects."""
+    for name in ("json", "jsonb"):
+        await conn.set_type_codec(
+            name, encoder=dumps, decoder=loads, schema="pg_catalog"
+        )
+
+
+# Shaped like the Wynncraft player endpoint, which dominates its responses
+PLAYER = {
+    "username": "Player",
+    "guild": {"name": "Guild", "prefix": "GLD", "rank": "chief"},
+    "globalData": {"wars": 12, "totalLevel": 1200, "killedMobs": 54321},
+    "ranking": {f"ranking{i}": i for i in range(200)},
+    "characters": {
+        f"{i:032x}": {"type": "MAGE", "level": 106, "xp": i, "quests": ["q"] * 80}
+        for i in range(15)
+    },
+}
+
+
+async def _submit(player: bytes) -> None:
+    """The CPU work of a submission, without Discord and the database."""
+    stats = loads(player)
+    await asyncio.sleep(0)
+    fields = [(f"Question {i}?", "Answer " * 100, False) for i in range(25)]
+    fields.append(("Guild:", stats["guild"]["name"], True))
+    messages = pack_embeds(stats["username"], 0x00AA00, datetime.now(UTC), fields)
+    await asyncio.sleep(0)
+    for embeds in messages:
+        dumps({"embeds": [e.to_dict() for e in embeds]})
+
+
+async def _benchmark(submits: int, concurrency: int) -> dict[str, float]:
+    player = dumps(PLAYER).encode()
+    lags: list[float] = []
+    done = asyncio.Event()
+
+    async def ticker() -> None:
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    async def worker(n: int) -> None:
+        for _ in range(n):
+            await _submit(player)
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(submits // concurrency) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+
+    quantiles = statistics.quantiles(lags, n=100, method="inclusive")
+    return {
+        "submits_per_second": round(submits / elapsed),
+        "lag_p50_ms": round(quantiles[49] * 1000, 3),
+        "lag_p99_ms": round(quantiles[98] * 1000, 3),
+        "lag_max_ms": round(max(lags) * 1000, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m utils.fast", description="Compare standard and fast mode."
+    )
+    parser.add_argument("--submits", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        install()
+        print(json.dumps(asyncio.run(_benchmark(args.submits, args.concurrency))))
+        return
+
+    for mode in ("0", "1"):
+        # Fresh interpreters, as the mode is chosen on import
+        result = subprocess.run(  # noqa: S603
+            [sys.executable, "-m", "utils.fast", "--child", *sys.argv[1:]],
+            env=os.environ | {"FORMBOT_FAST": mode},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        name = "fast" if mode == "1" else "standard"
+        print(f"{name:>8}: {result.stdout.strip()}")
+    print(f"discord.py orjson: {discord.utils.HAS_ORJSON}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Intents and caches of the gateway connection, set as FORMBOT_CACHE_PROFILE.
+
+The bot works on interactions, which need no intent. Beyond that it looks up
+result channels, which the guilds intent keeps cached, and removes the buttons
+of deleted messages, which guild messages deliver. The lean profile receives
+and caches only that, and is used unless FORMBOT_CACHE_PROFILE says otherwise.
+The default profile is that of discord.py.
+"""
+
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, cast
+
+import discord
+
+from utils.profiling import ROOT
+
+if TYPE_CHECKING:
+    from discord.types.user import User as UserPayload
+
+CACHE_PROFILE = os.environ.get("FORMBOT_CACHE_PROFILE", "lean")
+PROFILES = ("default", "lean")
+
+# Size of the benchmark, as guilds with channels each, and gateway events
+GUILDS = 50
+CHANNELS = 50
+EVENTS = 20_000
+# Share of each event in the traffic and the intent it needs
+TRAFFIC = {
+    "MESSAGE_CREATE": (0.6, "guild_messages"),
+    "TYPING_START": (0.2, "guild_typing"),
+    "MESSAGE_REACTION_ADD": (0.15, "guild_reactions"),
+    "MESSAGE_DELETE": (0.05, "guild_messages"),
+}
+
+
+def client_options(profile: str = CACHE_PROFILE) -> dict[str, Any]:
+    """Keyword arguments of discord.Client for a cache profile."""
+    if profile == "default":
+        return {"intents": discord.Intents.default()}
+    if profile != "lean":
+        raise ValueError(f"Unknown cache profile {profile!r}")
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    return {
+        "intents": intents,
+        "max_messages": None,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+    }
+
+
+def benchmark(path: Path) -> None:
+    """Compare memory and event CPU of the profiles, written as JSON.
+
+    Each profile runs in a fresh interpreter, so neither sees the memory of the
+    other. Synthetic guilds and events are fed to the parsers as if they came
+    from the gateway, dropping those the intents would not let through.
+    """
+    report = {}
+    for profile in PROFILES:
+        result = subprocess.run(  # noqa: S603
+            [
+                sys.executable,
+                "-c",
+                f"from utils.gateway import measure; measure({profile!r})",
+            ],
+            capture_output=True,
+            check=True,
+            cwd=ROOT,
+            text=True,
+        )
+        report[profile] = json.loads(result.stdout)
+    path.write_text(json.dumps(report, indent=2) + "\n")
+
+
+def measure(profile: str) -> None:
+    asyncio.run(_measure(profile))
+
+
+async def _measure(profile: str) -> None:
+    guilds = [_guild(1000 + g) for g in range(GUILDS)]
+    events = _events(random.Random(0))  # noqa: S311
+    client = discord.Client(**client_options(profile))
+    state = client._connection
+    bot = cast("UserPayload", _user(1) | {"bot": True})
+    state.user = discord.ClientUser(state=state, data=bot)
+    events = [(n, d) for n, d in events if getattr(client.intents, TRAFFIC[n][1])]
+
+    gc.collect()
+    start_rss = _rss()
+    for guild in guilds:
+        state.parsers["GUILD_CREATE"](guild)
+    guilds_rss = _rss()
+    start = time.process_time()
+    for name, data in events:
+        state.parsers[name](data)
+    cpu = time.process_time() - start
+    gc.collect()
+    report = {
+        "guilds_rss_mb": round((guilds_rss - start_rss) / 2**20, 2),
+        "events_rss_mb": round((_rss() - guilds_rss) / 2**20, 2),
+        "events_received": len(events),
+        "cpu_us_per_event": round(cpu / len(events) * 1e6, 2),
+        "cached_messages": len(client.cached_messages),
+    }
+    print(json.dumps(report))
+
+
+def _rss() -> int:
+    """Current resident memory in bytes, the peak where that is not available."""
+    statm = Path("/proc/self/statm")
+    if statm.exists():
+        return int(statm.read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _user(user_id: int) -> dict[str, Any]:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+    }
+
+
+def _member(user_id: int) -> dict[str, Any]:
+    return {
+        "user": _user(user_id),
+        "roles": [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def _guild(guild_id: int) -> dict[str, Any]:
+    roles = [
+        {
+            "id": str(guild_id * 100 + r),
+            "name": f"role{r}",
+            "permissions": "0",
+            "position": r,
+            "color": 0,
+            "hoist": False,
+            "managed": False,
+            "mentionable": False,
+        }
+        for r in range(30)
+    ]
+    roles[0]["id"] = str(guild_id)  # @everyone
+    return {
+        "id": str(guild_id),
+        "name": f"guild{guild_id}",
+        "owner_id": "1",
+        "features": [],
+        "roles": roles,
+        "emojis": [
+            {
+                "id": str(guild_id * 100 + e),
+                "name": f"emoji{e}",
+                "roles": [],
+                "require_colons": True,
+                "managed": False,
+                "animated": False,
+                "available": True,
+            }
+            for e in range(50)
+        ],
+        "stickers": [],
+        "channels": [
+            {
+                "id": str(guild_id * 1000 + c),
+                "type": 0,
+                "name": f"channel{c}",
+                "position": c,
+                "permission_overwrites": [],
+            }
+            for c in range(CHANNELS)
+        ],
+        "members": [_member(1)],
+        "threads": [],
+        "voice_states": [],
+        "presences": [],
+        "member_count": 1000,
+        "large": True,
+        "unavailable": False,
+        "premium_tier": 0,
+        "verification_level": 0,
+        "default_message_notifications": 0,
+        "explicit_content_filter": 0,
+        "mfa_level": 0,
+        "system_channel_flags": 0,
+        "nsfw_level": 0,
+        "preferred_locale": "en-US",
+        "afk_timeout": 300,
+    }
+
+
+def _events(rng: random.Random) -> list[tuple[str, dict[str, Any]]]:
+    names = list(TRAFFIC)
+    weights = [share for share, _ in TRAFFIC.values()]
+    events = []
+    for n, name in enumerate(rng.choices(names, weights, k=EVENTS)):
+        guild_id = 1000 + rng.randrange(GUILDS)
+        user_id = 10 + rng.randrange(5000)
+        ids = {
+            "guild_id": str(guild_id),
+            "channel_id": str(guild_id * 1000 + rng.randrange(CHANNELS)),
+        }
+        # Deletes and reactions target a recent message
+        recent = str(10**12 + max(0, n - rng.randrange(1, 50)))
+        if name == "MESSAGE_CREATE":
+            member = _member(user_id)
+            data = ids | {
+                "id": str(10**12 + n),
+                "author": member.pop("user"),
+                "member": member,
+                "content": "",
+                "timestamp": "2024-01-01T00:00:00+00:00",
+                "edited_timestamp": None,
+                "tts": False,
+                "mention_everyone": False,
+                "mentions": [],
+                "mention_roles": [],
+                "attachments": [],
+                "embeds": [],
+                "pinned": False,
+                "type": 0,
+            }
+        elif name == "TYPING_START":
+            data = ids | {
+                "user_id": str(user_id),
+                "timestamp": 0,
+                "member": _member(user_id),
+            }
+        elif name == "MESSAGE_REACTION_ADD":
+            data = ids | {
+                "user_id": str(user_id),
+                "message_id": recent,
+                "emoji": {"id": None, "name": "👍"},
+                "type": 0,
+                "burst": False,
+            }
+        else:
+            data = ids | {"id": recent}
+        events.append((name, data))
+    return events
@@ -0,0 +1,103 @@
+import contextlib
+import json
+import logging
+import os
+import queue
+import sys
+from collections import Counter
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.environ.get("FORMBOT_LOG_LEVEL", "INFO")
+# Keep one in this many debug records per logger, as "default,logger=rate,..."
+LOG_SAMPLE = os.environ.get("FORMBOT_LOG_SAMPLE", "10")
+QUEUE_SIZE = 10_000
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through one in `rate` debug records of each logger."""
+
+    def __init__(self, spec: str = LOG_SAMPLE) -> None:
+        super().__init__()
+        default, *overrides = spec.split(",")
+        self.default = int(default)
+        self.rates = {
+            name: int(rate) for name, rate in (o.split("=") for o in overrides)
+        }
+        self.counts: Counter[str] = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self.rates.get(record.name, self.default)
+        self.counts[record.name] += 1
+        return rate <= 1 or self.counts[record.name] % rate == 1
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueues without blocking, counting the records dropped on a full queue."""
+
+    def __init__(self, maxsize: int = QUEUE_SIZE) -> None:
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.reported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the arguments here, the listener thread formats the JSON
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped != self.reported:
+            dropped = self.dropped - self.reported
+            self.reported = self.dropped
+            notice = logging.makeLogRecord(
+                {
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Dropped {dropped} log records, queue was full",
+                }
+            )
+            with contextlib.suppress(queue.Full):
+                self.queue.put_nowait(notice)
+
+
+def setup_logging() -> QueueListener:
+    """Log as JSON lines to stderr from a background thread."""
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter())
+    handler = DroppingQueueHandler()
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    return listener
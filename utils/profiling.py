@@ -0,0 +1,177 @@
+import ast
+import json
+import subprocess
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+ENTRY = "client"
+
+
+class StartupProfile:
+    """Timings of the startup phases, written as JSON once the client is ready."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.start = time.perf_counter()
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    def write(self) -> None:
+        imports = import_times()
+        report = {
+            "imports_ms": imports,
+            "phases_ms": self.phases,
+            "ready_ms": round((time.perf_counter() - self.start) * 1000, 2),
+            **analyze_imports(),
+        }
+        self.path.write_text(json.dumps(report, indent=2) + "\n")
+
+
+def import_times() -> dict[str, float]:
+    """Measure the cumulative import time of each top-level package in ms.
+
+    Runs in a fresh interpreter, as everything is already imported in this one.
+    A package imported by another one is counted towards whichever imports it
+    first, e.g. aiohttp is usually part of discord.
+    """
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", f"import {ENTRY}"],
+        capture_output=True,
+        check=False,
+        cwd=ROOT,
+        text=True,
+    )
+    times: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        cumulative = int(parts[1]) / 1000
+        if "." not in name and cumulative >= 1:
+            times[name] = round(cumulative, 2)
+    return dict(sorted(times.items(), key=lambda x: x[1], reverse=True))
+
+
+def project_modules() -> dict[str, ast.Module]:
+    modules: dict[str, ast.Module] = {}
+    for path in ROOT.rglob("*.py"):
+        parts = path.relative_to(ROOT).with_suffix("").parts
+        if any(p.startswith(".") or p in ("venv", "build") for p in parts):
+            continue
+        name = ".".join(parts).removesuffix(".__init__")
+        modules[name] = ast.parse(path.read_text(), str(path))
+    return modules
+
+
+def analyze_imports() -> dict[str, list[str]]:
+    """Find imports that could be lazy, unreachable modules and broken imports.
+
+    Modules are reachable from the client, the tests and scripts with a main guard.
+
+    A third-party import is a lazy candidate if it is only used inside function
+    bodies, so it is not needed until the first call.
+    """
+    modules = project_modules()
+    defined = {name: _top_level_names(tree) for name, tree in modules.items()}
+
+    lazy: list[str] = []
+    broken: list[str] = []
+    graph: dict[str, set[str]] = {}
+    for name, tree in modules.items():
+        graph[name] = set()
+        bound: dict[str, str] = {}
+        for node in tree.body:
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    bound[alias.asname or alias.name.split(".")[0]] = alias.name
+                    graph[name].add(alias.name)
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                graph[name].add(node.module)
+                for alias in node.names:
+                    bound[alias.asname or alias.name] = node.module
+                    if f"{node.module}.{alias.name}" in modules:
+                        graph[name].add(f"{node.module}.{alias.name}")
+                    elif alias.name not in defined.get(node.module, {alias.name}):
+                        broken.append(f"{name}: {alias.name} from {node.module}")
+
+        eager = {n.id for n in _eager_nodes(tree) if isinstance(n, ast.Name)}
+        used = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}
+        lazy.extend(
+            f"{name}: {module}"
+            for local, module in bound.items()
+            if local in used
+            and local not in eager
+            and module not in modules
+            and module.split(".")[0] not in sys.stdlib_module_names
+        )
+
+    # Tests and scripts run on their own, so what they import is not dead
+    reachable: set[str] = set()
+    pending = [ENTRY]
+    pending.extend(name for name, tree in modules.items() if _is_root(name, tree))
+    while pending:
+        module = pending.pop()
+        if module in reachable or module not in modules:
+            continue
+        reachable.add(module)
+        pending.extend(graph[module])
+    return {
+        "lazy_import_candidates": sorted(set(lazy)),
+        "unreachable_modules": sorted(
+            m for m in modules if m not in reachable and modules[m].body
+        ),
+        "broken_imports": sorted(broken),
+    }
+
+
+def _is_root(name: str, tree: ast.Module) -> bool:
+    """Whether a module is run rather than imported, a test or has a main guard."""
+    if name.split(".")[0] == "tests":
+        return True
+    return any(
+        isinstance(node, ast.If)
+        and isinstance(node.test, ast.Compare)
+        and isinstance(node.test.left, ast.Name)
+        and node.test.left.id == "__name__"
+        for node in tree.body
+    )
+
+
+def _eager_nodes(node: ast.AST) -> Iterator[ast.AST]:
+    """Yield all nodes evaluated at import time, skipping function bodies."""
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, ast.FunctionDef | ast.AsyncFunctionDef):
+            yield from _eager_nodes(child.args)
+            for expr in (*child.decorator_list, child.returns):
+                if expr is not None:
+                    yield from ast.walk(expr)
+        else:
+            yield child
+            yield from _eager_nodes(child)
+
+
+def _top_level_names(tree: ast.Module) -> set[str]:
+    names: set[str] = set()
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef):
+            names.add(node.name)
+        elif isinstance(node, ast.Assign | ast.AnnAssign):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names.update(
+                n.id for t in targets for n in ast.walk(t) if isinstance(n, ast.Name)
+            )
+        elif isinstance(node, ast.Import | ast.ImportFrom):
+            names.update(a.asname or a.name.split(".")[0] for a in node.names)
+    return names
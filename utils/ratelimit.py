@@ -0,0 +1,47 @@
+import os
+import time
+
+from discord.app_commands import Cooldown
+
+# Defaults as "rate/per", overridable through the environment
+USER_LIMIT = os.environ.get("FORMBOT_USER_RATE_LIMIT", "3/60")
+FORM_LIMIT = os.environ.get("FORMBOT_FORM_RATE_LIMIT", "60/10")
+
+# Idle buckets are pruned once this many exist
+PRUNE_SIZE = 10_000
+
+
+def parse_limit(limit: str) -> tuple[float, float]:
+    rate, per = limit.split("/")
+    return float(rate), float(per)
+
+
+class RateLimiter:
+    """In-memory token buckets per (user, form) and per form."""
+
+    def __init__(
+        self, user_limit: str = USER_LIMIT, form_limit: str = FORM_LIMIT
+    ) -> None:
+        self.user_limit = parse_limit(user_limit)
+        self.form_limit = parse_limit(form_limit)
+        self.users: dict[tuple[int, int], Cooldown] = {}
+        self.forms: dict[int, Cooldown] = {}
+
+    def hit(self, user_id: int, form_id: int) -> float | None:
+        """Take a token for a user starting a form, or return the retry-after.
+
+        Legacy form buttons are limited by message ID before their form is known.
+        """
+        now = time.time()
+        if len(self.users) >= PRUNE_SIZE:
+            self.prune(now)
+
+        user = self.users.setdefault((user_id, form_id), Cooldown(*self.user_limit))
+        if retry_after := user.update_rate_limit(now):
+            return retry_after
+        form = self.forms.setdefault(form_id, Cooldown(*self.form_limit))
+        return form.update_rate_limit(now)
+
+    def prune(self, now: float) -> None:
+        self.users = {k: v for k, v in self.users.items() if v.get_tokens(now) < v.rate}
+        self.forms = {k: v for k, v in self.forms.items() if v.get_tokens(now) < v.rate}
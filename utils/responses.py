@@ -14,7 +14,14 @@ async def respond(
     edit: bool = False,
 ) -> None:
     embed = discord.Embed(color=color, title=title, description=f"{content:.4096}")
-    if edit:
+    if interaction.response.is_done():  # Deferred, see utils/admission.py
+        if edit:
+            await interaction.edit_original_response(
+                content=None, embed=embed, view=None
+            )
+        else:
+            await interaction.followup.send(embed=embed, ephemeral=True)
+    elif edit:
         await interaction.response.edit_message(content=None, embed=embed, view=None)
     else:
         await interaction.response.send_message(embed=embed, ephemeral=True)
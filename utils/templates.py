@@ -0,0 +1,158 @@
+import logging
+from dataclasses import asdict, dataclass, fields
+from typing import Any
+
+import discord
+
+from database.models import Form, Page, Question
+from database.repository import Repository
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class InputSpec:
+    question_id: int
+    label: str
+    field_name: str
+    description: str | None
+    placeholder: str | None
+    style: discord.TextStyle
+    required: bool
+    min_length: int | None
+    max_length: int
+    minecraft_username: bool
+
+    @classmethod
+    def compile(cls, question: Question) -> "InputSpec":
+        return cls(
+            question_id=question.id,
+            label=question.label,
+            field_name=question.label + ("" if question.label.endswith("?") else ":"),
+            description=question.description,
+            placeholder=question.placeholder,
+            style=(
+                discord.TextStyle.long
+                if question.paragraph
+                else discord.TextStyle.short
+            ),
+            required=question.required,
+            min_length=question.min_length,
+            max_length=question.max_length or 1000,
+            minecraft_username=question.minecraft_username,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class PageTemplate:
+    title: str
+    label: str
+    inputs: tuple[InputSpec, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class FormTemplate:
+    """Immutable form tree shared by all sessions filling out the form."""
+
+    form: Form
+    pages: tuple[PageTemplate, ...]
+
+    @classmethod
+    def compile(
+        cls, form: Form, data: list[tuple[Page, list[Question]]]
+    ) -> "FormTemplate":
+        return cls(
+            form=form,
+            pages=tuple(
+                PageTemplate(
+                    title=page.title or form.name,
+                    label=page.label,
+                    inputs=tuple(InputSpec.compile(q) for q in questions),
+                )
+                for page, questions in data
+            ),
+        )
+
+
+def to_snapshot(form: Form, data: list[tuple[Page, list[Question]]]) -> dict[str, Any]:
+    return {
+        "form": asdict(form),
+        "pages": [
+            {"page": asdict(page), "questions": [asdict(q) for q in questions]}
+            for page, questions in data
+        ],
+    }
+
+
+def from_snapshot(
+    tree: dict[str, Any],
+) -> tuple[Form, list[tuple[Page, list[Question]]]]:
+    return Form(**_fill(Form, tree["form"])), [
+        (
+            Page(**_fill(Page, p["page"])),
+            [Question(**_fill(Question, q)) for q in p["questions"]],
+        )
+        for p in tree["pages"]
+    ]
+
+
+def _fill(cls: type, data: dict[str, Any]) -> dict[str, Any]:
+    # Columns added after the snapshot was taken are unset
+    return {f.name: None for f in fields(cls)} | data
+
+
+class TemplateCache:
+    """Compiled templates of the latest version of each form.
+
+    Versions are immutable, so an entry is valid as long as its version is the
+    current one. While `trusted`, the listener invalidates changed forms and
+    entries are served without checking the version.
+    """
+
+    def __init__(self, repo: Repository) -> None:
+        self.repo = repo
+        self.templates: dict[int, FormTemplate] = {}
+        self.trusted = False
+        # Bumped on invalidation, so loads racing with it are not cached
+        self.generation = 0
+
+    def invalidate(self, form_id: int) -> None:
+        self.templates.pop(form_id, None)
+        self.generation += 1
+
+    def clear(self) -> None:
+        self.templates.clear()
+        self.generation += 1
+
+    async def get(self, form_id: int) -> FormTemplate | None:
+        if self.trusted and (template := self.templates.get(form_id)):
+            return template
+
+        generation = self.generation
+        version = await self.repo.form_version(form_id)
+        if version is None:
+            return None
+        template = self.templates.get(form_id)
+        if template is None or template.form.version != version:
+            template = await self.load(form_id, version)
+            if template is None:
+                return None
+            cached = self.templates.get(form_id)
+            if generation == self.generation and (
+                cached is None or cached.form.version < template.form.version
+            ):
+                self.templates[form_id] = template
+        return template
+
+    async def load(self, form_id: int, version: int) -> FormTemplate | None:
+        """Load a version from its snapshot, or snapshot the current version."""
+        if snapshot := await self.repo.snapshot(form_id, version):
+            return FormTemplate.compile(*from_snapshot(snapshot))
+
+        tree = await self.repo.form_tree(form_id)
+        if tree is None:
+            return None
+        form, data = tree
+        await self.repo.save_snapshot(form_id, form.version, to_snapshot(form, data))
+        log.debug("Published version %d of form %r", form.version, form.name)
+        return FormTemplate.compile(form, data)
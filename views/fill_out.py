@@ -1,51 +1,93 @@
+import asyncio
 import logging
+import uuid
 from datetime import UTC, datetime
 
 import aiohttp
-import asyncpg
 import discord
 from discord import ui
 
-from database.models import Form, Page, Question
+from database.history import history_field, minecraft_username
+from database.models import Limits
+from database.repository import LimitError, Repository
+from utils import fast
+from utils.admission import Admission, Priority
+from utils.dispatch import Dispatcher
+from utils.embeds import Field, pack_embeds
 from utils.responses import respond_error, respond_success
+from utils.templates import FormTemplate, InputSpec
 
 log = logging.getLogger(__name__)
 
+# Stats are optional, a slow API only leaves them out of the result
+STATS_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+
+def limit_reason(limits: Limits) -> str | None:
+    """Why the user cannot submit the form now, None if they can."""
+    if limits.closed:
+        return "This form is full and does not accept responses anymore."
+    if limits.next_submission is not None and (
+        limits.next_submission > discord.utils.utcnow()
+    ):
+        retry_at = discord.utils.format_dt(limits.next_submission, "R")
+        return f"You already submitted this form, you can do so again {retry_at}."
+    return None
+
 
 class FillOutView(ui.View):
     def __init__(
-        self, pool: asyncpg.Pool, form: Form, data: list[tuple[Page, list[Question]]]
+        self,
+        repo: Repository,
+        admission: Admission,
+        dispatcher: Dispatcher,
+        template: FormTemplate,
     ) -> None:
         super().__init__(timeout=None)
-        self.pool = pool
-        self.form = form
+        self.repo = repo
+        self.admission = admission
+        self.dispatcher = dispatcher
+        self.template = template
+        self.form = template.form
+        # Idempotency key, a response is recorded at most once per session
+        self.submission = uuid.uuid4()
+        self.submitted_at: datetime | None = None
+        self.stats: tuple[str, asyncio.Task[list[Field]]] | None = None
         self.answers: list[list[str | None]] = []
-        self.questions: list[list[Question]] = []
         self.buttons: list[FormButton] = []
 
-        for i, (page, questions) in enumerate(data):
-            self.answers.append([None] * len(questions))
-            self.questions.append(questions)
-            button = FormButton(self, page.title or form.name, page.label, i)
+        for i, page in enumerate(template.pages):
+            self.answers.append([None] * len(page.inputs))
+            button = FormButton(self, page.label, i)
             self.add_item(button)
             self.buttons.append(button)
         self.send_button = SendButton(self)
         self.add_item(self.send_button)
 
+    def prefetch_stats(self, username: str | None) -> None:
+        """Look up the stats of the entered username while the form is filled out."""
+        if self.stats is not None:
+            if self.stats[0] == username:
+                return
+            self.stats[1].cancel()
+            self.stats = None
+        if username is not None:
+            self.stats = (username, asyncio.create_task(fetch_player_stats(username)))
+
+    async def player_stats(self, username: str) -> list[Field]:
+        if self.stats is not None and self.stats[0] == username:
+            return await self.stats[1]
+        return await fetch_player_stats(username)
+
 
 class FormButton(ui.Button[FillOutView]):
-    def __init__(
-        self, parent_view: FillOutView, title: str, label: str, index: int
-    ) -> None:
+    def __init__(self, parent_view: FillOutView, label: str, index: int) -> None:
         super().__init__(label=label, style=discord.ButtonStyle.primary)
         self.parent_view = parent_view
-        self.title = title
         self.index = index
 
     async def callback(self, interaction: discord.Interaction) -> None:
-        await interaction.response.send_modal(
-            FormModal(self.parent_view, self.title, self.index)
-        )
+        await interaction.response.send_modal(FormModal(self.parent_view, self.index))
 
 
 class SendButton(ui.Button[FillOutView]):
@@ -54,78 +96,133 @@ class SendButton(ui.Button[FillOutView]):
         self.parent_view = parent_view
 
     async def callback(self, interaction: discord.Interaction) -> None:
-        query_response = (
-            "INSERT INTO responses (username, timestamp, form_id) VALUES ($1, $2, $3)"
-            " RETURNING id;"
-        )
-        query_answers = (
-            "INSERT INTO answers (response_id, question_id, answer)"
-            " VALUES ($1, $2, $3);"
+        # A double click can dispatch a second callback before the view stops
+        if self.parent_view.submitted_at is not None:
+            await interaction.response.defer()
+            return
+        self.parent_view.submitted_at = timestamp = datetime.now(UTC)
+        # The slot covers the database work only, not the stats or the reply
+        try:
+            async with self.parent_view.admission.admit(
+                interaction, Priority.SUBMIT, thinking=False
+            ) as admitted:
+                if not admitted:
+                    # The form stays open with its answers, to send again
+                    self.parent_view.submitted_at = None
+                    return
+                history = await self.record(interaction, timestamp)
+        except LimitError as e:
+            # Another response came first since the form was started
+            log.info(
+                "Rejected response of %s to form %r",
+                interaction.user,
+                self.parent_view.form.name,
+            )
+            msg = limit_reason(e.limits) or "You cannot submit this form right now."
+            await respond_error(interaction, msg, edit=True)
+            return
+        if history is None:
+            log.info("Ignored duplicate submission by %s", interaction.user)
+            if not interaction.response.is_done():
+                await interaction.response.defer()
+            return
+        await self.submit(interaction, timestamp, history)
+
+    def answered(self) -> tuple[list[InputSpec], list[str | None], int | None]:
+        """Questions and answers of all pages, and the Minecraft username index."""
+        all_questions = [
+            spec for page in self.parent_view.template.pages for spec in page.inputs
+        ]
+        all_answers = [a for page in self.parent_view.answers for a in page]
+        mc_index = next(
+            (i for i, q in enumerate(all_questions) if q.minecraft_username), None
         )
+        return all_questions, all_answers, mc_index
 
+    async def record(
+        self, interaction: discord.Interaction, timestamp: datetime
+    ) -> Field | None:
+        """Store the response, returning the applicant's history if it is new.
+
+        Raises LimitError like Repository.add_response.
+        """
         self.parent_view.stop()
         form = self.parent_view.form
+        all_questions, all_answers, mc_index = self.answered()
+        username = None if mc_index is None else all_answers[mc_index]
 
-        timestamp = datetime.now(UTC)
-
-        # Flatten questions and answers across all pages
-        all_questions = [q for page in self.parent_view.questions for q in page]
-        all_answers = [a for page in self.parent_view.answers for a in page]
+        # Looked up before inserting, so this response is not included
+        minecraft_name = minecraft_username(username)
+        history = await history_field(
+            self.parent_view.repo, interaction.user.id, minecraft_name
+        )
 
-        # Find the Minecraft username question if one is flagged
-        username = None
-        mc_index = next(
-            (i for i, q in enumerate(all_questions) if q.minecraft_username), None
+        response_id = await self.parent_view.repo.add_response(
+            interaction.user.name,
+            interaction.user.id,
+            minecraft_name,
+            timestamp,
+            form.id,
+            form.version,
+            self.parent_view.submission,
+            [
+                (q.question_id, a)
+                for i, (q, a) in enumerate(zip(all_questions, all_answers, strict=True))
+                if i != mc_index
+            ],
         )
-        if mc_index is not None:
-            username = all_answers[mc_index]
+        return None if response_id is None else history
+
+    async def submit(
+        self, interaction: discord.Interaction, timestamp: datetime, history: Field
+    ) -> None:
+        form = self.parent_view.form
+        all_questions, all_answers, mc_index = self.answered()
+        username = None if mc_index is None else all_answers[mc_index]
 
-        # Build the response embed
-        embed = discord.Embed(color=0x859900, title=form.name, timestamp=timestamp)
+        # Collect the response fields, packed into embeds once stats are known
+        title = form.name
+        fields: list[Field] = []
         if username is not None:
-            embed.title = f"{form.name} - {username}"
-            embed.add_field(name="Minecraft username:", value=username, inline=False)
-            embed.add_field(name="Discord username:", value=interaction.user.name)
+            title = f"{form.name} - {username}"
+            fields.append(("Minecraft username:", username, False))
+            fields.append(("Discord username:", interaction.user.name, True))
         else:
-            embed.add_field(name="Username:", value=interaction.user.display_name)
+            fields.append(("Username:", interaction.user.display_name, True))
 
         for i, (question, answer) in enumerate(
             zip(all_questions, all_answers, strict=True)
         ):
             if i == mc_index:
                 continue
-            embed.add_field(
-                name=question.label + ("" if question.label.endswith("?") else ":"),
-                value=answer or "---",
-                inline=False,
-            )
-
-        # Insert response and answers in a single transaction
-        async with self.parent_view.pool.acquire() as conn, conn.transaction():
-            response_id: int = await conn.fetchval(
-                query_response, interaction.user.name, timestamp, form.id
-            )
-            answers_for_db = [
-                (response_id, q.id, a)
-                for i, (q, a) in enumerate(zip(all_questions, all_answers, strict=True))
-                if i != mc_index
-            ]
-            await conn.executemany(query_answers, answers_for_db)
+            fields.append((question.field_name, answer or "---", False))
 
         if username is not None:
-            await add_player_stats(embed, username)
+            fields.extend(await self.parent_view.player_stats(username))
+        fields.append(history)
+        messages = pack_embeds(title, 0x859900, timestamp, fields)
 
         if form.channel is not None and isinstance(
             channel := interaction.client.get_channel(form.channel),
             discord.TextChannel | discord.Thread,
         ):
-            try:
-                await channel.send("@everyone" if form.ping else None, embed=embed)
+            # Sending is queued, so check permissions up front to report errors
+            permissions = channel.permissions_for(channel.guild.me)
+            can_send = (
+                permissions.send_messages_in_threads
+                if isinstance(channel, discord.Thread)
+                else permissions.send_messages
+            )
+            if can_send and permissions.embed_links:
+                if form.digest:
+                    self.parent_view.dispatcher.digest(channel, form, title, messages)
+                else:
+                    self.parent_view.dispatcher.send(channel, messages, ping=form.ping)
                 log.info("%s submitted form %r", interaction.user, form.name)
                 await respond_success(
                     interaction, form.confirmation or "Response recorded!", edit=True
                 )
-            except discord.Forbidden:
+            else:
                 log.warning(
                     "No permission to send to channel %d for form %r",
                     form.channel,
@@ -144,65 +241,72 @@ class SendButton(ui.Button[FillOutView]):
 
 
 class FormModal(ui.Modal):
-    def __init__(self, view: FillOutView, title: str, index: int) -> None:
-        super().__init__(title=title)
+    def __init__(self, view: FillOutView, index: int) -> None:
+        page = view.template.pages[index]
+        super().__init__(title=page.title)
         self.view = view
         self.index = index
         self.inputs: list[ui.TextInput[FormModal]] = []
 
-        for question, value in zip(
-            view.questions[index], view.answers[index], strict=False
-        ):
+        # Only the components are per modal, everything else comes from the template
+        for spec, value in zip(page.inputs, view.answers[index], strict=False):
             text_input: ui.TextInput[FormModal] = ui.TextInput(
-                style=(
-                    discord.TextStyle.long
-                    if question.paragraph
-                    else discord.TextStyle.short
-                ),
-                placeholder=question.placeholder,
+                style=spec.style,
+                placeholder=spec.placeholder,
                 default=value,
-                required=question.required,
-                min_length=question.min_length,
-                max_length=question.max_length or 1000,
+                required=spec.required,
+                min_length=spec.min_length,
+                max_length=spec.max_length,
             )
             self.inputs.append(text_input)
             self.add_item(
                 ui.Label(
-                    text=question.label,
-                    description=question.description,
-                    component=text_input,
+                    text=spec.label, description=spec.description, component=text_input
                 )
             )
 
     async def on_submit(self, interaction: discord.Interaction) -> None:
-        for i, text_input in enumerate(self.inputs):
-            self.view.answers[self.index][i] = text_input.value or None
+        page = self.view.template.pages[self.index]
+        for i, (spec, text_input) in enumerate(
+            zip(page.inputs, self.inputs, strict=True)
+        ):
+            answer = self.view.answers[self.index][i] = text_input.value or None
+            if spec.minecraft_username:
+                self.view.prefetch_stats(answer)
         self.view.buttons[self.index].style = discord.ButtonStyle.secondary
         if all(
-            all(a is not None or not q.required for a, q in zip(*x, strict=False))
-            for x in zip(self.view.answers, self.view.questions, strict=False)
+            a is not None or not spec.required
+            for answers, page in zip(
+                self.view.answers, self.view.template.pages, strict=False
+            )
+            for a, spec in zip(answers, page.inputs, strict=False)
         ):
             self.view.send_button.disabled = False
         await interaction.response.edit_message(view=self.view)
 
 
-async def add_player_stats(embed: discord.Embed, username: str) -> None:
-    async with aiohttp.ClientSession() as session:
-        player_url = f"https://api.wynncraft.com/v3/player/{username}"
-        res = await session.get(player_url)
-        if res.status != 200:
-            return
-        stats = await res.json()
-
-        highest_class = None
-        res = await session.get(player_url + "/characters")
-        if res.status == 200:
-            try:
-                highest_class = max(
-                    (await res.json()).values(), key=lambda x: (x["level"], x["xp"])
-                )
-            except (ValueError, KeyError):
-                log.debug("Failed to parse characters for %s", username)
+async def fetch_player_stats(username: str) -> list[Field]:
+    highest_class = None
+    try:
+        async with aiohttp.ClientSession(timeout=STATS_TIMEOUT) as session:
+            player_url = f"https://api.wynncraft.com/v3/player/{username}"
+            res = await session.get(player_url)
+            if res.status != 200:
+                return []
+            stats = await res.json(loads=fast.loads)
+
+            res = await session.get(player_url + "/characters")
+            if res.status == 200:
+                try:
+                    highest_class = max(
+                        (await res.json(loads=fast.loads)).values(),
+                        key=lambda x: (x["level"], x["xp"]),
+                    )
+                except (ValueError, KeyError):
+                    log.debug("Failed to parse characters for %s", username)
+    except (aiohttp.ClientError, TimeoutError):
+        log.warning("Failed to fetch stats for %s", username)
+        return []
 
     try:
         guild_text = (
@@ -223,29 +327,19 @@ async def add_player_stats(embed: discord.Embed, username: str) -> None:
             if highest_class is not None
             else ""
         )
-        embed.add_field(
-            name="", value=f"```ansi\n{first}\n{second}\n{third}\n```", inline=False
-        )
-        embed.add_field(
-            name="Total Level",
-            value=f"```hs\n{stats['globalData']['totalLevel']}\n```",
-        )
-        embed.add_field(
-            name="Raids",
-            value=f"```hs\n{stats['globalData']['raids']['total']}\n```",
-        )
-        embed.add_field(name="Wars", value=f"```hs\n{stats['globalData']['wars']}\n```")
-        embed.add_field(
-            name="Rank",
-            value=(
-                f"```hs\n{str(stats['supportRank']).title().replace('plus', '+')}\n```"
+        return [
+            ("", f"```ansi\n{first}\n{second}\n{third}\n```", False),
+            ("Total Level", f"```hs\n{stats['globalData']['totalLevel']}\n```", True),
+            ("Raids", f"```hs\n{stats['globalData']['raids']['total']}\n```", True),
+            ("Wars", f"```hs\n{stats['globalData']['wars']}\n```", True),
+            (
+                "Rank",
+                f"```hs\n{str(stats['supportRank']).title().replace('plus', '+')}\n```",
+                True,
             ),
-        )
-        embed.add_field(
-            name="First Join", value=f"```hs\n{stats['firstJoin'][:10]}\n```"
-        )
-        embed.add_field(
-            name="Playtime", value=f"```hs\n{stats['playtime']:.0f} Hours\n```"
-        )
+            ("First Join", f"```hs\n{stats['firstJoin'][:10]}\n```", True),
+            ("Playtime", f"```hs\n{stats['playtime']:.0f} Hours\n```", True),
+        ]
     except (KeyError, TypeError):
         log.debug("Incomplete stats for %s", username)
+        return []
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import discord
+from discord import ui
+
+from database.history import PAGE_SIZE
+from database.models import HistoryEntry
+from database.repository import Repository
+
+
+class HistoryView(ui.View):
+    """Pages through the responses of an applicant with keyset cursors."""
+
+    def __init__(
+        self,
+        repo: Repository,
+        title: str,
+        user_id: int | None,
+        minecraft_name: str | None,
+    ) -> None:
+        super().__init__(timeout=600)
+        self.repo = repo
+        self.title = title
+        self.user_id = user_id
+        self.minecraft_name = minecraft_name
+        # Cursors of the pages before the current one, None for the first page
+        self.cursors: list[tuple[datetime, int] | None] = []
+        self.cursor: tuple[datetime, int] | None = None
+        self.entries: list[HistoryEntry] = []
+
+    async def load(self) -> discord.Embed:
+        # One extra entry tells whether there are older ones
+        self.entries = await self.repo.history_page(
+            self.user_id, self.minecraft_name, self.cursor, PAGE_SIZE + 1
+        )
+        self.newer_button.disabled = not self.cursors
+        self.older_button.disabled = len(self.entries) <= PAGE_SIZE
+
+        embed = discord.Embed(color=0x859900, title=self.title)
+        embed.description = (
+            "\n".join(
+                f"{discord.utils.format_dt(e.timestamp, 'f')} **{e.form_name}**"
+                f" by {e.username}"
+                + (f" ({e.minecraft_username})" if e.minecraft_username else "")
+                for e in self.entries[:PAGE_SIZE]
+            )
+            or "No responses found."
+        )
+        embed.set_footer(text=f"Page {len(self.cursors) + 1}")
+        return embed
+
+    @ui.button(label="Newer", emoji="⬅️", style=discord.ButtonStyle.secondary)
+    async def newer_button(
+        self, interaction: discord.Interaction, _: ui.Button["HistoryView"]
+    ) -> None:
+        self.cursor = self.cursors.pop()
+        await interaction.response.edit_message(embed=await self.load(), view=self)
+
+    @ui.button(label="Older", emoji="➡️", style=discord.ButtonStyle.secondary)
+    async def older_button(
+        self, interaction: discord.Interaction, _: ui.Button["HistoryView"]
+    ) -> None:
+        last = self.entries[PAGE_SIZE - 1]
+        self.cursors.append(self.cursor)
+        self.cursor = (last.timestamp, last.id)
+        await interaction.response.edit_message(embed=await self.load(), view=self)
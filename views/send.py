@@ -1,69 +1,94 @@
+import asyncio
 import logging
+import os
+from typing import TYPE_CHECKING, cast
 
-import asyncpg
 import discord
 from discord import ui
 
-from database.models import Form
+from database.repository import Repository
+from utils.dispatch import Channel
 from utils.responses import respond_error, respond_success
 from views.starter import StarterView
 
+if TYPE_CHECKING:
+    from client import Client
+
 log = logging.getLogger(__name__)
 
+# Discord allows up to 25 options in a select
+FORMS_PER_PAGE = 25
+# Channels a message can be sent to at once, and sends in flight across all of them
+MAX_CHANNELS = 25
+SEND_CONCURRENCY = int(os.environ.get("FORMBOT_SEND_CONCURRENCY", "5"))
+sends = asyncio.Semaphore(SEND_CONCURRENCY)
+
+
+def no_forms() -> discord.SelectOption:
+    # A new option for each view, as show() marks its options as default
+    return discord.SelectOption(label="No forms found", value="0")
+
 
 class SendView(ui.View):
     def __init__(
         self,
-        pool: asyncpg.Pool,
-        channel: discord.TextChannel | discord.Thread,
+        repo: Repository,
+        channel: Channel,
         content: str,
         embed: discord.Embed,
-        forms: list[Form],
     ) -> None:
         super().__init__(timeout=None)
-        self.pool = pool
-        self.channel = channel
+        self.repo = repo
+        self.channels = [channel]
         self.content = content
         self.embed = embed
-        self.forms = forms
+        self.add_item(ChannelSelect(channel))
+        # Label, emoji, style, form id and form name of each button
         self.buttons: list[
-            tuple[str | None, str | None, int, int | None, ui.Select[SendView]]
-        ] = []
+            tuple[str | None, str | None, int, int | None, str | None]
+        ] = [(None, None, 2, None, None)]
         self.current_button = 0
-        self.new_button()
-        self.add_item(self.buttons[0][4])
-
-    def new_button(self) -> None:
-        select: ui.Select[SendView] = FormSelect(
-            placeholder="Select a form for this button",
-            options=[
-                discord.SelectOption(label=form.name, value=str(form.id))
-                for form in self.forms
-            ],
-            row=1,
+        # One page of forms shared by all buttons, loaded by name after a cursor
+        self.search = ""
+        self.cursors: list[str | None] = [None]
+        self.next_cursor: str | None = None
+        self.form_select = FormSelect(options=[no_forms()], row=1)
+        self.add_item(self.form_select)
+
+    async def load_forms(self) -> None:
+        forms = await self.repo.form_page(
+            self.search, self.cursors[-1], FORMS_PER_PAGE + 1
         )
-        self.buttons.append((None, None, 2, None, select))
+        more = len(forms) > FORMS_PER_PAGE
+        forms = forms[:FORMS_PER_PAGE]
+        self.form_select.options = [
+            discord.SelectOption(label=name, value=str(form_id))
+            for form_id, name in forms
+        ] or [no_forms()]
+        self.form_select.disabled = not forms
+        self.previous_forms.disabled = len(self.cursors) == 1
+        self.next_forms.disabled = not more
+        if more:
+            self.next_cursor = forms[-1][1]
+        self.show()
 
-    async def update(
-        self,
-        interaction: discord.Interaction,
-        prev_select: ui.Select["SendView"] | None = None,
-    ) -> None:
-        self.embed.clear_fields()
+    def show(self) -> None:
         data = self.buttons[self.current_button]
+        self.embed.clear_fields()
         self.embed.add_field(
             name=f"Button {self.current_button + 1}/{len(self.buttons)}",
             value=(
                 f"Current Label: {data[0] or '[None]'}\nCurrent Emoji:"
-                f" {data[1] or '[None]'}"
+                f" {data[1] or '[None]'}\nCurrent Form: {data[4] or '[None]'}"
             ),
         )
-        self.style_button.style = discord.ButtonStyle(
-            self.buttons[self.current_button][2]
-        )
-        if prev_select is not None:
-            self.remove_item(prev_select)
-            self.add_item(self.buttons[self.current_button][4])
+        self.style_button.style = discord.ButtonStyle(data[2])
+        for option in self.form_select.options:
+            option.default = option.value == str(data[3])
+        self.form_select.placeholder = data[4] or "Select a form for this button"
+
+    async def update(self, interaction: discord.Interaction) -> None:
+        self.show()
         await interaction.response.edit_message(embed=self.embed, view=self)
 
     @ui.button(style=discord.ButtonStyle.primary, label="Edit Button", row=2)
@@ -85,46 +110,37 @@ class SendView(ui.View):
     async def delete_button(
         self, interaction: discord.Interaction, _: ui.Button["SendView"]
     ) -> None:
-        prev_select = self.buttons[self.current_button][4]
         if len(self.buttons) > 0:
             del self.buttons[self.current_button]
             self.current_button = (self.current_button - 1) % len(self.buttons)
-        await self.update(interaction, prev_select)
+        await self.update(interaction)
 
     @ui.button(style=discord.ButtonStyle.primary, emoji="⬅️", row=3)
     async def back_button(
         self, interaction: discord.Interaction, _: ui.Button["SendView"]
     ) -> None:
-        prev_select = self.buttons[self.current_button][4]
         self.current_button = (self.current_button - 1) % len(self.buttons)
-        await self.update(interaction, prev_select)
+        await self.update(interaction)
 
     @ui.button(label="Add Button", style=discord.ButtonStyle.primary, emoji="➕", row=3)
     async def add_button(
         self, interaction: discord.Interaction, _: ui.Button["SendView"]
     ) -> None:
-        prev_select = self.buttons[self.current_button][4]
         self.current_button = len(self.buttons)
-        self.new_button()
-        await self.update(interaction, prev_select)
+        self.buttons.append((None, None, 2, None, None))
+        await self.update(interaction)
 
     @ui.button(style=discord.ButtonStyle.primary, emoji="➡️", row=3)
     async def next_button(
         self, interaction: discord.Interaction, _: ui.Button["SendView"]
     ) -> None:
-        prev_select = self.buttons[self.current_button][4]
         self.current_button = (self.current_button + 1) % len(self.buttons)
-        await self.update(interaction, prev_select)
+        await self.update(interaction)
 
     @ui.button(label="Send", style=discord.ButtonStyle.success, emoji="📨", row=3)
     async def send_button(
         self, interaction: discord.Interaction, _: ui.Button["SendView"]
     ) -> None:
-        query = (
-            "INSERT INTO form_views (message_id, label, emoji, style, form_id)"
-            " VALUES ($1, $2, $3, $4, $5);"
-        )
-
         if any(b[0] is None or b[3] is None for b in self.buttons):
             await respond_error(
                 interaction, "You must set the label and form for each button."
@@ -136,54 +152,162 @@ class SendView(ui.View):
             await respond_error(interaction, "Button labels must be unique.")
             return
 
-        try:
-            msg = await self.channel.send(self.content)
-        except discord.Forbidden:
-            log.warning("No permission to send to channel %d", self.channel.id)
-            await respond_error(
-                interaction,
-                f"No access to <#{self.channel.id}>, message could not be sent.",
-            )
-            return
-
+        await interaction.response.defer()
         setup_data = [
             (b[0] or "", b[1], discord.ButtonStyle(b[2]), b[3] or 0)
             for b in self.buttons
         ]
-        await msg.edit(view=StarterView(self.pool, msg.id, setup_data))
-
-        await self.pool.executemany(
-            query, [(msg.id, b[0], b[1], b[2], b[3]) for b in self.buttons]
+        results = await asyncio.gather(
+            *(self.send_to(channel, setup_data) for channel in self.channels)
         )
-        log.info(
-            "%s sent form message to channel %d",
-            interaction.user,
-            self.channel.id,
+        sent = [msg for msg in results if isinstance(msg, discord.Message)]
+        failed = [
+            f"<#{channel.id}>: {error}"
+            for channel, error in zip(self.channels, results, strict=True)
+            if isinstance(error, str)
+        ]
+        if sent:
+            message_ids = [msg.id for msg in sent]
+            await self.repo.add_form_views(
+                message_ids,
+                [(b[0] or "", b[1], b[2], b[3] or 0) for b in self.buttons],
+            )
+            cast("Client", interaction.client).form_messages.update(message_ids)
+            log.info(
+                "%s sent form message to channels %s",
+                interaction.user,
+                ", ".join(str(msg.channel.id) for msg in sent),
+            )
+        if not failed:
+            await respond_success(
+                interaction,
+                "Message sent to "
+                + ", ".join(f"<#{msg.channel.id}>" for msg in sent)
+                + ".",
+                edit=True,
+            )
+            return
+        await respond_error(
+            interaction,
+            f"Message sent to {len(sent)} of {len(self.channels)} channels."
+            " Failed:\n" + "\n".join(failed),
+        )
+
+    async def send_to(
+        self,
+        channel: Channel,
+        setup_data: list[tuple[str, str | None, discord.ButtonStyle, int]],
+    ) -> discord.Message | str:
+        """Send the message to one channel, or return why that failed."""
+        async with sends:
+            try:
+                return await channel.send(self.content, view=StarterView(setup_data))
+            except discord.Forbidden:
+                log.warning("No permission to send to channel %d", channel.id)
+                return "no access"
+            except discord.HTTPException as e:
+                log.warning("Failed to send to channel %d: %s", channel.id, e)
+                return e.text or str(e.status)
+
+    @ui.button(label="Search Forms", emoji="🔍", row=4)
+    async def search_forms(
+        self, interaction: discord.Interaction, _: ui.Button["SendView"]
+    ) -> None:
+        await interaction.response.send_modal(SearchModal(self))
+
+    @ui.button(label="Previous Forms", disabled=True, row=4)
+    async def previous_forms(
+        self, interaction: discord.Interaction, _: ui.Button["SendView"]
+    ) -> None:
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await self.load_forms()
+        await self.update(interaction)
+
+    @ui.button(label="More Forms", disabled=True, row=4)
+    async def next_forms(
+        self, interaction: discord.Interaction, _: ui.Button["SendView"]
+    ) -> None:
+        self.cursors.append(self.next_cursor)
+        await self.load_forms()
+        await self.update(interaction)
+
+
+class ChannelSelect(ui.ChannelSelect[SendView]):
+    def __init__(self, channel: Channel) -> None:
+        super().__init__(
+            channel_types=[
+                discord.ChannelType.text,
+                discord.ChannelType.news,
+                discord.ChannelType.public_thread,
+                discord.ChannelType.private_thread,
+                discord.ChannelType.news_thread,
+            ],
+            placeholder="Select the channels to send the message to",
+            max_values=MAX_CHANNELS,
+            default_values=[channel],
+            row=0,
         )
-        await respond_success(
-            interaction, f"Message sent to <#{self.channel.id}>.", edit=True
+
+    async def callback(self, interaction: discord.Interaction) -> None:
+        if self.view is None:
+            await respond_error(interaction, "Something went wrong.")
+            return
+        channels = []
+        for value in self.values:
+            channel = value.resolve() or await value.fetch()
+            if isinstance(channel, Channel):
+                channels.append(channel)
+        self.default_values = channels
+        self.view.channels = channels
+        self.view.embed.description = "Will be sent in " + ", ".join(
+            c.mention for c in channels
         )
+        await self.view.update(interaction)
 
 
 class FormSelect(ui.Select[SendView]):
     async def callback(self, interaction: discord.Interaction) -> None:
         selected_option = None
         for option in self.options:
-            option.default = False
             if option.value == self.values[0]:
                 selected_option = option
-        if selected_option is None:
+        if selected_option is None or self.view is None:
             await respond_error(interaction, "Something went wrong.")
             return
-        value = int(selected_option.value)
-        if self.view is not None:
-            buttons = self.view.buttons
-            current_button = self.view.current_button
-            v1, v2, v3, _, v4 = buttons[current_button]
-            buttons[current_button] = (v1, v2, v3, value, v4)
-        self.placeholder = selected_option.label
-        selected_option.default = True
-        await interaction.response.edit_message(view=self.view)
+        buttons = self.view.buttons
+        current_button = self.view.current_button
+        v1, v2, v3, _, _ = buttons[current_button]
+        buttons[current_button] = (
+            v1,
+            v2,
+            v3,
+            int(selected_option.value),
+            selected_option.label,
+        )
+        await self.view.update(interaction)
+
+
+class SearchModal(ui.Modal):
+    def __init__(self, view: SendView) -> None:
+        super().__init__(title="Search Forms")
+        self.view = view
+        self.search_input: ui.TextInput[SendView] = ui.TextInput(
+            default=view.search, required=False, max_length=45
+        )
+        self.add_item(
+            ui.Label(
+                text="Name contains",
+                description="Leave empty to list all forms.",
+                component=self.search_input,
+            )
+        )
+
+    async def on_submit(self, interaction: discord.Interaction) -> None:
+        self.view.search = self.search_input.value
+        self.view.cursors = [None]
+        await self.view.load_forms()
+        await self.view.update(interaction)
 
 
 class EditModal(ui.Modal):
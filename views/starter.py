@@ -1,63 +1,148 @@
 import logging
+import re
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, cast
 
-import asyncpg
 import discord
 from discord import ui
 
-from database.models import Form, Page, Question
+from utils.admission import Priority
 from utils.responses import respond_error
-from views.fill_out import FillOutView
+from views.fill_out import FillOutView, limit_reason
+
+if TYPE_CHECKING:
+    from client import Client
 
 log = logging.getLogger(__name__)
 
 
 class StarterView(ui.View):
     def __init__(
-        self,
-        pool: asyncpg.Pool,
-        message_id: int,
-        setup_data: list[tuple[str, str | None, discord.ButtonStyle, int]],
+        self, setup_data: list[tuple[str, str | None, discord.ButtonStyle, int]]
     ) -> None:
         super().__init__(timeout=None)
-        for i, datum in enumerate(setup_data):
-            button = ApplicationButton(pool, *datum, custom_id=f"{message_id}-{i}")
-            self.add_item(button)
+        for i, (label, emoji, style, form_id) in enumerate(setup_data):
+            self.add_item(ApplicationButton(form_id, i, label, emoji, style))
+
 
+class ApplicationButton(
+    ui.DynamicItem[ui.Button[ui.View]],
+    template=r"form:(?P<form_id>[0-9]+):(?P<index>[0-9]+)",
+):
+    """Routes clicks on form buttons of all messages by their custom ID."""
 
-class ApplicationButton(ui.Button[StarterView]):
     def __init__(
         self,
-        pool: asyncpg.Pool,
-        label: str,
-        emoji: str | None,
-        style: discord.ButtonStyle,
         form_id: int,
-        custom_id: str,
+        index: int,
+        label: str | None = None,
+        emoji: str | None = None,
+        style: discord.ButtonStyle = discord.ButtonStyle.secondary,
     ) -> None:
-        super().__init__(style=style, label=label, emoji=emoji, custom_id=custom_id)
-        self.pool = pool
+        super().__init__(
+            ui.Button(
+                style=style,
+                label=label,
+                emoji=emoji,
+                custom_id=f"form:{form_id}:{index}",
+            )
+        )
         self.form_id = form_id
 
+    @classmethod
+    async def from_custom_id(
+        cls, _: discord.Interaction, __: ui.Item[Any], match: re.Match[str], /
+    ) -> "ApplicationButton":
+        return cls(int(match["form_id"]), int(match["index"]))
+
     async def callback(self, interaction: discord.Interaction) -> None:
-        query_form = "SELECT * FROM forms WHERE id = $1;"
-        query_pages = "SELECT * FROM pages WHERE form_id = $1 ORDER BY id;"
-        query_questions = "SELECT * FROM questions WHERE page_id = $1 ORDER BY id;"
+        await start_form(interaction, self.form_id)
+
 
-        row = await self.pool.fetchrow(query_form, self.form_id)
-        if row is None:
-            log.warning("Form %d not found in database", self.form_id)
+class LegacyApplicationButton(
+    ui.DynamicItem[ui.Button[ui.View]],
+    template=r"(?P<message_id>[0-9]+)-(?P<index>[0-9]+)",
+):
+    """Buttons sent before the form ID was part of the custom ID.
+
+    Looks the form up in form_views and migrates the message on first click.
+    """
+
+    def __init__(self, message_id: int, index: int) -> None:
+        super().__init__(ui.Button(custom_id=f"{message_id}-{index}"))
+        self.message_id = message_id
+        self.index = index
+
+    @classmethod
+    async def from_custom_id(
+        cls, _: discord.Interaction, __: ui.Item[Any], match: re.Match[str], /
+    ) -> "LegacyApplicationButton":
+        return cls(int(match["message_id"]), int(match["index"]))
+
+    async def callback(self, interaction: discord.Interaction) -> None:
+        # Limited by message before the lookup, by form again when it starts
+        if await rate_limited(interaction, self.message_id):
+            return
+        client = cast("Client", interaction.client)
+        form_views = await client.repo.form_views(self.message_id)
+        if self.index >= len(form_views):
             await respond_error(interaction, "This form does not exist anymore.")
             return
+        await start_form(interaction, form_views[self.index].form_id)
 
-        form = Form(**dict(row))
-        data = []
-        for page_row in await self.pool.fetch(query_pages, self.form_id):
-            page = Page(**dict(page_row))
-            question_rows = await self.pool.fetch(query_questions, page.id)
-            data.append((page, [Question(**dict(q)) for q in question_rows]))
-        log.info("%s started form %r", interaction.user, form.name)
-        await interaction.response.send_message(
-            f"## {form.name}\n\n{form.message}\n** **",
-            view=FillOutView(self.pool, form, data),
-            ephemeral=True,
-        )
+        if interaction.message is None:
+            return
+        setup_data = [
+            (v.label, v.emoji, discord.ButtonStyle(v.style), v.form_id)
+            for v in form_views
+        ]
+        try:
+            await interaction.message.edit(view=StarterView(setup_data))
+        except discord.HTTPException as e:
+            log.warning("Failed to migrate form message %d: %s", self.message_id, e)
+        else:
+            log.info("Migrated form message %d", self.message_id)
+
+
+async def rate_limited(interaction: discord.Interaction, key: int) -> bool:
+    """Take a token of the user for a form, telling them when to retry if spent."""
+    client = cast("Client", interaction.client)
+    retry_after = client.limiter.hit(interaction.user.id, key)
+    if retry_after is None:
+        return False
+    retry_at = discord.utils.utcnow() + timedelta(seconds=retry_after)
+    await respond_error(
+        interaction,
+        "You are starting forms too quickly, try again"
+        f" {discord.utils.format_dt(retry_at, 'R')}.",
+    )
+    return True
+
+
+async def start_form(interaction: discord.Interaction, form_id: int) -> None:
+    client = cast("Client", interaction.client)
+    if await rate_limited(interaction, form_id):
+        return
+
+    async with client.admission.admit(interaction, Priority.START) as admitted:
+        if not admitted:
+            return
+        # Counters only, so a full form is turned away before it is loaded
+        limits = await client.repo.limits(form_id, interaction.user.id)
+        if limits is not None and (reason := limit_reason(limits)):
+            await respond_error(interaction, reason)
+            return
+        template = None if limits is None else await client.templates.get(form_id)
+    if template is None:
+        log.warning("Form %d not found in database", form_id)
+        await respond_error(interaction, "This form does not exist anymore.")
+        return
+
+    form = template.form
+    log.info("%s started form %r", interaction.user, form.name)
+    content = f"## {form.name}\n\n{form.message}\n** **"
+    view = FillOutView(client.repo, client.admission, client.dispatcher, template)
+    if interaction.response.is_done():
+        await interaction.followup.send(content, view=view, ephemeral=True)
+    else:
+        await interaction.response.send_message(content, view=view, ephemeral=True)